@@ -94,7 +94,8 @@ def setup_ssm_parameters(ssm):
         '/review-app/processed-bucket': 'review-processed-bucket',
         '/review-app/sentiment-bucket': 'review-sentiment-bucket',
         '/review-app/reviews-table': 'reviews-table',
-        '/review-app/users-table': 'users-table'
+        '/review-app/users-table': 'users-table',
+        '/review-app/jobs-table': 'jobs-table'
     }
     
     for param_name, param_value in parameters.items():
@@ -122,7 +123,10 @@ def create_s3_buckets(s3):
             print(f"Bucket creation failed for {bucket_name}: {e}")
 
 def create_dynamodb_tables(dynamodb):
-    # Reviews table
+    # Reviews table. profanity-index is sparse, profane_customer is only written
+    # on reviews with profanity. There is no index on sentiment_label: nothing
+    # queries by label, and its three values would put every review in one of
+    # three partitions.
     try:
         reviews_table = dynamodb.create_table(
             TableName='reviews-table',
@@ -132,7 +136,18 @@ def create_dynamodb_tables(dynamodb):
             ],
             AttributeDefinitions=[
                 {'AttributeName': 'customerId', 'AttributeType': 'S'},
-                {'AttributeName': 'reviewId', 'AttributeType': 'S'}
+                {'AttributeName': 'reviewId', 'AttributeType': 'S'},
+                {'AttributeName': 'profane_customer', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': 'profanity-index',
+                    'KeySchema': [
+                        {'AttributeName': 'profane_customer', 'KeyType': 'HASH'},
+                        {'AttributeName': 'reviewId', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'KEYS_ONLY'}
+                }
             ],
             BillingMode='PAY_PER_REQUEST',
             StreamSpecification={
@@ -145,7 +160,8 @@ def create_dynamodb_tables(dynamodb):
     except Exception as e:
         print(f"Reviews table creation failed: {e}")
     
-    # Users table
+    # Users table. banned-index is sparse: banned_flag is only written on banned
+    # users (user_management), so listing them reads only those items
     try:
         users_table = dynamodb.create_table(
             TableName='users-table',
@@ -153,7 +169,18 @@ def create_dynamodb_tables(dynamodb):
                 {'AttributeName': 'customerId', 'KeyType': 'HASH'}
             ],
             AttributeDefinitions=[
-                {'AttributeName': 'customerId', 'AttributeType': 'S'}
+                {'AttributeName': 'customerId', 'AttributeType': 'S'},
+                {'AttributeName': 'banned_flag', 'AttributeType': 'S'}
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    'IndexName': 'banned-index',
+                    'KeySchema': [
+                        {'AttributeName': 'banned_flag', 'KeyType': 'HASH'},
+                        {'AttributeName': 'customerId', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'INCLUDE', 'NonKeyAttributes': ['unpolite_review_count']}
+                }
             ],
             BillingMode='PAY_PER_REQUEST'
         )
@@ -162,6 +189,26 @@ def create_dynamodb_tables(dynamodb):
     except Exception as e:
         print(f"Users table creation failed: {e}")
 
+    # Jobs table, one job per uploaded review object (common.jobs): a meta item
+    # and sharded counters bumped by preprocessing, profanity and sentiment
+    try:
+        dynamodb.create_table(
+            TableName='jobs-table',
+            KeySchema=[
+                {'AttributeName': 'jobId', 'KeyType': 'HASH'},
+                {'AttributeName': 'part', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'jobId', 'AttributeType': 'S'},
+                {'AttributeName': 'part', 'AttributeType': 'S'}
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        print("Jobs table created successfully")
+
+    except Exception as e:
+        print(f"Jobs table creation failed: {e}")
+
 def create_lambda_functions(lambda_client):
     functions = [
         {
@@ -208,6 +255,10 @@ def create_lambda_functions(lambda_client):
         except Exception as e:
             print(f"Lambda function creation failed for {func['name']}: {e}")
 
+# Shared helpers (e.g. common.jsoncodec) from the main pipeline, packaged as
+# the `common` package next to every handler
+COMMON_PATH = '../../src/lambdas/common'
+
 def create_deployment_package(code_path, zip_path):
     with zipfile.ZipFile(zip_path, 'w') as zip_file:
         for root, dirs, files in os.walk(code_path):
@@ -215,6 +266,12 @@ def create_deployment_package(code_path, zip_path):
                 file_path = os.path.join(root, file)
                 arcname = os.path.relpath(file_path, code_path)
                 zip_file.write(file_path, arcname)
+        for root, dirs, files in os.walk(COMMON_PATH):
+            for file in files:
+                if file.endswith('.py'):
+                    file_path = os.path.join(root, file)
+                    arcname = os.path.join('common', os.path.relpath(file_path, COMMON_PATH))
+                    zip_file.write(file_path, arcname)
 
 def setup_s3_events(s3, lambda_client):
     # Raw bucket -> Preprocessing function
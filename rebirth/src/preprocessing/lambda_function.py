@@ -1,4 +1,3 @@
-import json
 import boto3
 import nltk
 import re
@@ -24,6 +23,9 @@ except LookupError:
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 from nltk.stem import WordNetLemmatizer
+from common.jobs import job_update, set_expected, start_job
+from common.jsoncodec import dumpb, dumps, loads
+from common.tracing import Span, event_time_ms, new_trace_id
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -33,9 +35,12 @@ def lambda_handler(event, context):
         # Initialize AWS clients
         s3 = boto3.client('s3', endpoint_url='http://localstack:4566')
         ssm = boto3.client('ssm', endpoint_url='http://localstack:4566')
+        dynamodb = boto3.client('dynamodb', endpoint_url='http://localstack:4566')
         
         # Get parameters from SSM
         processed_bucket = ssm.get_parameter(Name='/review-app/processed-bucket')['Parameter']['Value']
+        jobs_table = ssm.get_parameter(Name='/review-app/jobs-table')['Parameter']['Value']
+        span = Span('preprocessing')
         
         # Process S3 event
         for record in event['Records']:
@@ -44,34 +49,47 @@ def lambda_handler(event, context):
             
             logger.info(f"Processing file: {key} from bucket: {bucket}")
             
+            # Every uploaded object is one job holding one review; the jobId
+            # travels with the review through the later stages
+            start_job(dynamodb, jobs_table, key, sourceKey=key)
+            
             # Download and parse the review
             response = s3.get_object(Bucket=bucket, Key=key)
-            review_data = json.loads(response['Body'].read().decode('utf-8'))
+            review_data = loads(response['Body'].read())
             
             # Preprocess the review
             processed_review = preprocess_review(review_data)
+            processed_review['jobId'] = key
+            # Carried through the processed and sentiment buckets and into reviews-table
+            processed_review['traceId'] = new_trace_id()
+            processed_review['uploadedAt'] = event_time_ms(record)
             
             # Store processed review
             processed_key = f"processed/{key}"
             s3.put_object(
                 Bucket=processed_bucket,
                 Key=processed_key,
-                Body=json.dumps(processed_review),
+                Body=dumpb(processed_review),
                 ContentType='application/json'
             )
             
+            dynamodb.update_item(**job_update(jobs_table, key, {'preprocessed': 1}))
+            set_expected(dynamodb, jobs_table, key, 1)
+            span.add(processed_review['traceId'], processed_review['uploadedAt'])
+            
             logger.info(f"Processed review stored at: {processed_key}")
             
+        span.emit()
         return {
             'statusCode': 200,
-            'body': json.dumps('Preprocessing completed successfully')
+            'body': dumps('Preprocessing completed successfully')
         }
         
     except Exception as e:
         logger.error(f"Error in preprocessing: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps(f'Error: {str(e)}')
+            'body': dumps(f'Error: {str(e)}')
         }
 
 def preprocess_review(review_data):
@@ -1,8 +1,10 @@
-import json
 import boto3
 from better_profanity import profanity
 import logging
 from datetime import datetime
+from common.jobs import job_update
+from common.jsoncodec import dumpb, dumps, loads
+from common.tracing import Span
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -17,8 +19,10 @@ def lambda_handler(event, context):
         # Get parameters from SSM
         sentiment_bucket = ssm.get_parameter(Name='/review-app/sentiment-bucket')['Parameter']['Value']
         reviews_table_name = ssm.get_parameter(Name='/review-app/reviews-table')['Parameter']['Value']
+        jobs_table = ssm.get_parameter(Name='/review-app/jobs-table')['Parameter']['Value']
         
         reviews_table = dynamodb.Table(reviews_table_name)
+        span = Span('profanity_check')
         
         # Process S3 event
         for record in event['Records']:
@@ -29,13 +33,15 @@ def lambda_handler(event, context):
             
             # Download and parse the processed review
             response = s3.get_object(Bucket=bucket, Key=key)
-            review_data = json.loads(response['Body'].read().decode('utf-8'))
+            review_data = loads(response['Body'].read())
             
             # Perform profanity check
             profanity_result = check_profanity(review_data)
             
             # Store profanity check results in DynamoDB
             store_review_result(reviews_table, review_data, profanity_result)
+            if 'jobId' in review_data:
+                dynamodb.meta.client.update_item(**job_update(jobs_table, review_data['jobId'], {'profanityChecked': 1}))
             
             # Forward to sentiment analysis
             review_data.update(profanity_result)
@@ -44,22 +50,24 @@ def lambda_handler(event, context):
             s3.put_object(
                 Bucket=sentiment_bucket,
                 Key=sentiment_key,
-                Body=json.dumps(review_data),
+                Body=dumpb(review_data),
                 ContentType='application/json'
             )
             
+            span.add(review_data.get('traceId'), review_data.get('uploadedAt'))
             logger.info(f"Profanity check completed for: {key}")
             
+        span.emit()
         return {
             'statusCode': 200,
-            'body': json.dumps('Profanity check completed successfully')
+            'body': dumps('Profanity check completed successfully')
         }
         
     except Exception as e:
         logger.error(f"Error in profanity check: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps(f'Error: {str(e)}')
+            'body': dumps(f'Error: {str(e)}')
         }
 
 def check_profanity(review_data):
@@ -105,5 +113,11 @@ def store_review_result(table, review_data, profanity_result):
         'created_at': datetime.utcnow().isoformat(),
         'status': 'profanity_checked'
     }
+    for field in ('jobId', 'traceId', 'uploadedAt'):
+        if field in review_data:
+            item[field] = review_data[field]
+    # Only profane reviews carry profane_customer, which keeps profanity-index sparse
+    if profanity_result['has_profanity']:
+        item['profane_customer'] = customer_id
     
     table.put_item(Item=item)
\ No newline at end of file
@@ -1,8 +1,10 @@
-import json
 import boto3
 from textblob import TextBlob
 import logging
 from datetime import datetime
+from common.jobs import job_update
+from common.jsoncodec import dumps, loads
+from common.tracing import Span
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -16,8 +18,10 @@ def lambda_handler(event, context):
         
         # Get parameters from SSM
         reviews_table_name = ssm.get_parameter(Name='/review-app/reviews-table')['Parameter']['Value']
+        jobs_table = ssm.get_parameter(Name='/review-app/jobs-table')['Parameter']['Value']
         
         reviews_table = dynamodb.Table(reviews_table_name)
+        span = Span('sentiment_analysis')
         
         # Process S3 event
         for record in event['Records']:
@@ -28,26 +32,30 @@ def lambda_handler(event, context):
             
             # Download and parse the review
             response = s3.get_object(Bucket=bucket, Key=key)
-            review_data = json.loads(response['Body'].read().decode('utf-8'))
+            review_data = loads(response['Body'].read())
             
             # Perform sentiment analysis
             sentiment_result = analyze_sentiment(review_data)
             
             # Update review in DynamoDB
             update_review_sentiment(reviews_table, review_data, sentiment_result)
+            if 'jobId' in review_data:
+                dynamodb.meta.client.update_item(**job_update(jobs_table, review_data['jobId'], {'sentimentDone': 1}))
             
+            span.add(review_data.get('traceId'), review_data.get('uploadedAt'))
             logger.info(f"Sentiment analysis completed for: {key}")
             
+        span.emit()
         return {
             'statusCode': 200,
-            'body': json.dumps('Sentiment analysis completed successfully')
+            'body': dumps('Sentiment analysis completed successfully')
         }
         
     except Exception as e:
         logger.error(f"Error in sentiment analysis: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps(f'Error: {str(e)}')
+            'body': dumps(f'Error: {str(e)}')
         }
 
 def analyze_sentiment(review_data):
@@ -1,8 +1,8 @@
-import json
 import boto3
 import logging
 from datetime import datetime
 from boto3.dynamodb.conditions import Key
+from common.jsoncodec import dumps
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -39,25 +39,32 @@ def lambda_handler(event, context):
                 
         return {
             'statusCode': 200,
-            'body': json.dumps('User management completed successfully')
+            'body': dumps('User management completed successfully')
         }
         
     except Exception as e:
         logger.error(f"Error in user management: {str(e)}")
         return {
             'statusCode': 500,
-            'body': json.dumps(f'Error: {str(e)}')
+            'body': dumps(f'Error: {str(e)}')
         }
 
 def count_unpolite_reviews(table, customer_id):
+    # The sparse profanity-index holds only this customer's profane reviews, so
+    # the count no longer reads (or pages through) all of their reviews
     try:
-        response = table.query(
-            KeyConditionExpression=Key('customerId').eq(customer_id),
-            FilterExpression='has_profanity = :true',
-            ExpressionAttributeValues={':true': True}
-        )
-        
-        return response['Count']
+        kwargs = {
+            'IndexName': 'profanity-index',
+            'KeyConditionExpression': Key('profane_customer').eq(customer_id),
+            'Select': 'COUNT'
+        }
+        count = 0
+        while True:
+            response = table.query(**kwargs)
+            count += response['Count']
+            if 'LastEvaluatedKey' not in response:
+                return count
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
         
     except Exception as e:
         logger.error(f"Error counting unpolite reviews: {str(e)}")
@@ -86,6 +93,9 @@ def update_user_status(table, customer_id, unpolite_count):
     if ban_reason:
         item['ban_reason'] = ban_reason
         item['banned_at'] = datetime.utcnow().isoformat()
+        # Key of the sparse banned-index; the put drops it again when the
+        # customer is no longer banned
+        item['banned_flag'] = 'BANNED'
     
     table.put_item(Item=item)
     
@@ -1,10 +1,17 @@
+import os
+import sys
 import pytest
 import boto3
 import json
-import time
 from datetime import datetime
 import uuid
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', 'lambdas'))
+from common.jobs import get_job, wait_for_job, wait_until
+
+# Upper bound per wait; the waits return as soon as the pipeline is done
+PIPELINE_TIMEOUT = 120
+
 class TestReviewAnalysisIntegration:
     
     @classmethod
@@ -16,9 +23,24 @@ class TestReviewAnalysisIntegration:
         # Table references
         cls.reviews_table = cls.dynamodb.Table('reviews-table')
         cls.users_table = cls.dynamodb.Table('users-table')
+        cls.jobs_table = 'jobs-table'
         
         # Test data
         cls.test_customer_id = f"test_customer_{uuid.uuid4()}"
+    
+    def wait_for_job(self, key):
+        # Every uploaded object is one job; complete once sentiment is done
+        return wait_for_job(self.dynamodb.meta.client, self.jobs_table, key, timeout=PIPELINE_TIMEOUT)
+    
+    def wait_for_user(self, customer_id, check):
+        # user-management runs from the reviews stream, after the job's stages
+        def current():
+            item = self.users_table.get_item(Key={'customerId': customer_id}, ConsistentRead=True).get('Item')
+            return item if item and check(item) else None
+        try:
+            return wait_until(current, timeout=PIPELINE_TIMEOUT)
+        except TimeoutError:
+            return self.users_table.get_item(Key={'customerId': customer_id}).get('Item')
         
     def test_01_preprocessing_functionality(self):
         # Create test review
@@ -39,8 +61,9 @@ class TestReviewAnalysisIntegration:
             ContentType='application/json'
         )
         
-        # Wait for processing
-        time.sleep(5)
+        # Wait for preprocessing only
+        wait_until(lambda: (get_job(self.dynamodb.meta.client, self.jobs_table, key) or {}).get('preprocessed'),
+                   timeout=PIPELINE_TIMEOUT)
         
         # Check if processed file exists
         try:
@@ -82,7 +105,7 @@ class TestReviewAnalysisIntegration:
         )
         
         # Wait for processing
-        time.sleep(10)
+        self.wait_for_job(key)
         
         # Check DynamoDB for results
         try:
@@ -123,7 +146,7 @@ class TestReviewAnalysisIntegration:
         )
         
         # Wait for processing
-        time.sleep(10)
+        self.wait_for_job(key)
         
         # Check DynamoDB for results
         try:
@@ -164,7 +187,7 @@ class TestReviewAnalysisIntegration:
         )
         
         # Wait for processing
-        time.sleep(15)
+        self.wait_for_job(key)
         
         # Check DynamoDB for sentiment results
         try:
@@ -207,7 +230,7 @@ class TestReviewAnalysisIntegration:
         )
         
         # Wait for processing
-        time.sleep(15)
+        self.wait_for_job(key)
         
         # Check DynamoDB for sentiment results
         try:
@@ -259,10 +282,10 @@ class TestReviewAnalysisIntegration:
                 Body=json.dumps(review),
                 ContentType='application/json'
             )
-            time.sleep(5)  # Wait between uploads
+            self.wait_for_job(key)  # Reviews are counted in upload order
         
-        # Wait for all processing to complete
-        time.sleep(20)
+        # Wait for user management to catch up
+        self.wait_for_user(self.test_customer_id, lambda user: int(user.get('unpolite_review_count', 0)) >= 2)
         
         # Check user status
         try:
@@ -309,10 +332,10 @@ class TestReviewAnalysisIntegration:
                 Body=json.dumps(review),
                 ContentType='application/json'
             )
-            time.sleep(5)
+            self.wait_for_job(key)
         
-        # Wait for processing
-        time.sleep(25)
+        # Wait for user management to catch up
+        self.wait_for_user(self.test_customer_id, lambda user: user.get('status') == 'banned')
         
         # Check if user is banned
         try:
@@ -353,7 +376,7 @@ class TestReviewAnalysisIntegration:
         )
         
         # Wait for complete processing
-        time.sleep(20)
+        self.wait_for_job(key)
         
         # Verify all stages completed
         try:
@@ -0,0 +1,291 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas', 'pre_process'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas', 'sentiment'))
+from common.aggregates import counter_update
+from common.errors import condition_failed
+from common.jsoncodec import dumps, loads
+from common.product_stats import product_update, review_asin
+from common.queries import sentiment_label
+from common.scan import scan_segment
+from common.text_codec import decode_text
+from common.throttle import RETRY_CONFIG, limiter_from_env, transact_write
+
+# Brings existing reviews up to the current PREPROCESS_VERSION (pre_process)
+# and SENTIMENT_VERSION (sentiment) after the stopwords, the lemmatizer or the
+# sentiment thresholds changed, instead of deleting and re-uploading:
+#   python code/backfill.py --dry-run
+#   python code/backfill.py --segments 16 --checkpoint backfill.json
+# Stale reviews are found with a parallel scan. Processed text is recomputed
+# from the raw line in S3 (sourceKey/sourceOffset/sourceLength), the label from
+# the processed text. Only those attributes (UPDATED_FIELDS) are written back,
+# so a concurrent profanity check is never undone, in one transaction with the
+# sentiment counters its new label moves in Aggregates and ProductStats,
+# conditioned on the versions and label it was read with, so an item is never
+# counted twice and one changed in the meantime is left alone. All writes go
+# through the adaptive rate limiter (DYNAMODB_RATE etc.). After each page the
+# scan position of its segment is saved to the checkpoint file, so a rerun with
+# the same file resumes where an interrupted one stopped.
+# pre_process and sentiment are imported with the settings of the deployed
+# pre_process function (SPELL_CORRECTION changes PREPROCESS_VERSION), not the
+# ones of the shell running this. Reviews still PENDING are skipped; profanity
+# results and the search index are not recomputed.
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+# Deployed pre_process settings that change what it computes
+PIPELINE_SETTINGS = ('SPELL_CORRECTION', 'TEXT_CACHE_TABLE')
+PREPROCESS_FUNCTIONS = ('pre_process', 'pre-process')
+# The attributes a backfill recomputes; nothing else of a review is written
+UPDATED_FIELDS = ('processedreviewText', 'processedSummary', 'preprocessVersion',
+                  'sentiment', 'sentimentLabel', 'sentimentVersion')
+
+ssm = boto3.client("ssm", endpoint_url=endpoint_url)
+s3 = boto3.client("s3", endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url,
+                        config=Config(max_pool_connections=32).merge(RETRY_CONFIG))
+limiter = limiter_from_env()
+limiter.attach(dynamodb)
+lambda_client = boto3.client("lambda", endpoint_url=endpoint_url)
+pre_process = None
+sentiment = None
+
+STALE_FILTER = (
+    'attribute_not_exists(reviewStatus) AND sentiment <> :pending AND ('
+    'attribute_not_exists(preprocessVersion) OR preprocessVersion <> :pv OR '
+    'attribute_not_exists(sentimentVersion) OR sentimentVersion <> :sv)'
+)
+
+
+def table(name):
+    return ssm.get_parameter(Name=f'/review-app/{name}')['Parameter']['Value']
+
+
+def deployed_settings(functions):
+    for name in functions:
+        try:
+            config = lambda_client.get_function_configuration(FunctionName=name)
+        except lambda_client.exceptions.ResourceNotFoundException:
+            continue
+        variables = config.get('Environment', {}).get('Variables', {})
+        return {setting: variables[setting] for setting in PIPELINE_SETTINGS if setting in variables}
+    raise SystemExit(f"None of the functions {', '.join(functions)} is deployed")
+
+
+def load_pipeline(settings):
+    # The modules read their settings and create their clients at import time
+    global pre_process, sentiment
+    for setting in PIPELINE_SETTINGS:
+        os.environ.pop(setting, None)
+    os.environ.update(settings)
+    os.environ['AWS_ENDPOINT_URL'] = endpoint_url
+    import pre_process
+    import sentiment
+    pre_process.s3 = s3
+    pre_process.dynamodb = dynamodb
+    pre_process.text_cache.dynamodb = dynamodb
+
+
+class Checkpoint:
+    # {'versions': [...], 'segments': n, 'keys': {segment: LastEvaluatedKey},
+    #  'done': [segments]}, rewritten atomically after every page
+    def __init__(self, path, versions, segments):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {'versions': versions, 'segments': segments, 'keys': {}, 'done': []}
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                state = loads(f.read())
+            if state['versions'] != versions or state['segments'] != segments:
+                raise SystemExit(f"{path} was written for versions {state['versions']} and "
+                                 f"{state['segments']} segments; remove it to start over")
+            self.state = state
+
+    def start_key(self, segment):
+        return self.state['keys'].get(str(segment))
+
+    def is_done(self, segment):
+        return segment in self.state['done']
+
+    def save(self, segment, last_key):
+        if not self.path:
+            return
+        with self.lock:
+            if last_key:
+                self.state['keys'][str(segment)] = last_key
+            else:
+                self.state['keys'].pop(str(segment), None)
+                self.state['done'].append(segment)
+            with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(dumps(self.state))
+            os.replace(self.path + '.tmp', self.path)
+
+
+class Backfill:
+    def __init__(self, bucket, tables, checkpoint, dry_run=False):
+        self.bucket = bucket
+        self.tables = tables
+        self.checkpoint = checkpoint
+        self.dry_run = dry_run
+        self.lock = threading.Lock()
+        self.stats = {'stale': 0, 'written': 0, 'reprocessed': 0, 'relabeled': 0, 'noSource': 0, 'changed': 0,
+                      'failed': 0}
+
+    def count(self, **counts):
+        with self.lock:
+            for name, count in counts.items():
+                self.stats[name] += count
+
+    def reprocess(self, item):
+        # New processed text from the raw line; False when the item predates
+        # the source location stamps and cannot be reprocessed
+        if 'sourceKey' not in item:
+            return False
+        line = pre_process.read_line(self.bucket, item['sourceKey']['S'],
+                                     int(item['sourceOffset']['N']), int(item['sourceLength']['N']))
+        review_data = loads(line)
+        fresh = pre_process.build_item(review_data)
+        if fresh['reviewId'] != item['reviewId']:
+            raise ValueError(f"{item['sourceKey']['S']}@{item['sourceOffset']['N']} is no longer this review")
+        for field in ('processedreviewText', 'processedSummary', 'preprocessVersion'):
+            item[field] = fresh[field]
+        return True
+
+    def update(self, item, deltas):
+        # Brings one item up to date in place and adds the label change to
+        # deltas; returns False if nothing changed
+        changed = False
+        text_changed = False
+        if item.get('preprocessVersion', {}).get('S') != pre_process.PREPROCESS_VERSION:
+            if self.reprocess(item):
+                text_changed = changed = True
+                self.count(reprocessed=1)
+            else:
+                self.count(noSource=1)
+        if text_changed or item.get('sentimentVersion', {}).get('S') != sentiment.SENTIMENT_VERSION:
+            old = item['sentiment']['S']
+            new = sentiment.get_sentiment(
+                decode_text(item['processedreviewText']) + " " + decode_text(item['processedSummary']))
+            item['sentiment'] = {'S': new}
+            item['sentimentLabel'] = {'S': sentiment_label(new, item['reviewId']['S'])}
+            item['sentimentVersion'] = {'S': sentiment.SENTIMENT_VERSION}
+            changed = True
+            if new != old:
+                self.count(relabeled=1)
+                deltas[old.lower()] = -1
+                deltas[new.lower()] = 1
+        return changed
+
+    def write(self, item, old, deltas):
+        # The recomputed fields and their counter changes in one transaction,
+        # only if the item still has the versions and label it was read with:
+        # a crash can not separate them, and a resumed or concurrent run finds
+        # it changed. Only those fields are SET, so a profanity result written
+        # since the scan is kept.
+        conditions = []
+        values = {}
+        for i, (name, value) in enumerate(sorted(old.items())):
+            if value is None:
+                conditions.append(f'attribute_not_exists({name})')
+            else:
+                conditions.append(f'{name} = :o{i}')
+                values[f':o{i}'] = value
+        sets = []
+        for name in UPDATED_FIELDS:
+            if name in item:
+                sets.append(f'{name} = :{name}')
+                values[f':{name}'] = item[name]
+        transact_items = [{'Update': {
+            'TableName': self.tables['reviews'],
+            'Key': {'reviewerID': item['reviewerID'], 'reviewId': item['reviewId']},
+            'UpdateExpression': 'SET ' + ', '.join(sets),
+            'ConditionExpression': ' AND '.join(conditions),
+            'ExpressionAttributeValues': values
+        }}]
+        if deltas:
+            transact_items.append({'Update': counter_update(self.tables['aggregates'], deltas)})
+            asin = review_asin(item)
+            if asin:
+                transact_items.append({'Update': product_update(self.tables['products'], asin, deltas)})
+        try:
+            transact_write(dynamodb, transact_items)
+        except ClientError as e:
+            if not condition_failed(e):
+                raise
+            self.count(changed=1)
+        else:
+            self.count(written=1)
+
+    def handle_page(self, segment, page):
+        for item in page['Items']:
+            self.count(stale=1)
+            old = {name: item.get(name) for name in ('sentiment', 'preprocessVersion', 'sentimentVersion')}
+            deltas = {}
+            try:
+                if self.update(item, deltas) and not self.dry_run:
+                    self.write(item, old, deltas)
+            except Exception as e:
+                print(f"Could not backfill {item['reviewId']['S']}: {e}")
+                self.count(failed=1)
+        self.checkpoint.save(segment, page.get('LastEvaluatedKey'))
+
+    def run(self, segments, workers=None):
+        scan_kwargs = {
+            'FilterExpression': STALE_FILTER,
+            'ExpressionAttributeValues': {
+                ':pending': {'S': 'PENDING'},
+                ':pv': {'S': pre_process.PREPROCESS_VERSION},
+                ':sv': {'S': sentiment.SENTIMENT_VERSION}
+            }
+        }
+        todo = [segment for segment in range(segments) if not self.checkpoint.is_done(segment)]
+        with ThreadPoolExecutor(max_workers=workers or segments) as pool:
+            futures = [
+                pool.submit(scan_segment, dynamodb, self.tables['reviews'], segment, segments, self.handle_page,
+                            self.checkpoint.start_key(segment), **scan_kwargs)
+                for segment in todo
+            ]
+            for future in futures:
+                future.result()
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute reviews processed by an older pipeline version")
+    parser.add_argument('--segments', type=int, default=8, help="parallel scan segments")
+    parser.add_argument('--workers', type=int, default=None, help="threads, default one per segment")
+    parser.add_argument('--checkpoint', default='backfill-checkpoint.json',
+                        help="progress file used to resume; empty string to disable")
+    parser.add_argument('--dry-run', action='store_true', help="only count what would change")
+    parser.add_argument('--function', action='append',
+                        help="deployed pre_process function to take the settings from, default "
+                             + " or ".join(PREPROCESS_FUNCTIONS))
+    args = parser.parse_args()
+
+    settings = deployed_settings(args.function or PREPROCESS_FUNCTIONS)
+    print(f"Pipeline settings of the deployed function: {settings}")
+    load_pipeline(settings)
+    versions = [pre_process.PREPROCESS_VERSION, sentiment.SENTIMENT_VERSION]
+    checkpoint = Checkpoint(None if args.dry_run else args.checkpoint or None, versions, args.segments)
+    tables = {name: table(f'tables/{name}') for name in ('reviews', 'aggregates', 'products')}
+    backfill = Backfill(table('buckets/reviews'), tables, checkpoint, args.dry_run)
+
+    start = time.perf_counter()
+    stats = backfill.run(args.segments, args.workers)
+    elapsed = time.perf_counter() - start
+    print(dumps(dict(stats, seconds=round(elapsed, 2), versions=versions, **limiter.metrics())))
+    if not args.dry_run and args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.errors import condition_failed
+from common.jsoncodec import dumps
+from common.queries import BANNED_FLAG, SENTIMENT_KEY, sentiment_label
+from common.scan import parallel_scan
+from common.throttle import RETRY_CONFIG, limiter_from_env
+
+# Adds the sparse index keys to items stored before the handlers wrote them:
+# bannedFlag on users banned earlier (BannedIndex) and sentimentLabel on
+# reviews labelled earlier (SentimentIndex). Safe to rerun, only items still
+# missing the key are updated:
+#   python code/backfill_index_keys.py --dry-run
+#   python code/backfill_index_keys.py --segments 16
+# A Reviews table created with the old SentimentIndex (keyed on sentiment) has
+# to get the new index first:
+#   awslocal dynamodb update-table --table-name Reviews \
+#     --global-secondary-index-updates '[{"Delete": {"IndexName": "SentimentIndex"}}]'
+#   awslocal dynamodb update-table --table-name Reviews \
+#     --attribute-definitions AttributeName=sentimentLabel,AttributeType=S AttributeName=reviewId,AttributeType=S \
+#     --global-secondary-index-updates '[{"Create": {"IndexName": "SentimentIndex",
+#       "KeySchema": [{"AttributeName": "sentimentLabel", "KeyType": "HASH"}, {"AttributeName": "reviewId", "KeyType": "RANGE"}],
+#       "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["overall", "profanityCheck"]}}]'
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+ssm = boto3.client("ssm", endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url,
+                        config=Config(max_pool_connections=32).merge(RETRY_CONFIG))
+limiter = limiter_from_env()
+limiter.attach(dynamodb)
+
+LABELS = ('POSITIVE', 'NEUTRAL', 'NEGATIVE')
+
+
+def table(name):
+    return ssm.get_parameter(Name=f'/review-app/tables/{name}')['Parameter']['Value']
+
+
+class KeyBackfill:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.stats = {'users': 0, 'reviews': 0, 'changed': 0}
+        self.lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def update(self, **kwargs):
+        # The condition re-checks the scanned state, so an item the pipeline
+        # changed in the meantime is left alone
+        if self.dry_run:
+            return
+        try:
+            dynamodb.update_item(**kwargs)
+        except ClientError as e:
+            if not condition_failed(e):
+                raise
+            self.count('changed')
+
+    def users(self, table_name, segments, workers):
+        def handle_page(segment, page):
+            for item in page['Items']:
+                self.count('users')
+                self.update(
+                    TableName=table_name,
+                    Key={'reviewerID': item['reviewerID']},
+                    UpdateExpression='SET bannedFlag = :flag',
+                    ConditionExpression='banned = :true AND attribute_not_exists(bannedFlag)',
+                    ExpressionAttributeValues={':flag': {'S': BANNED_FLAG}, ':true': {'BOOL': True}}
+                )
+
+        parallel_scan(dynamodb, table_name, handle_page, segments=segments, workers=workers,
+                      ProjectionExpression='reviewerID',
+                      FilterExpression='banned = :true AND attribute_not_exists(bannedFlag)',
+                      ExpressionAttributeValues={':true': {'BOOL': True}})
+
+    def reviews(self, table_name, segments, workers):
+        def handle_page(segment, page):
+            for item in page['Items']:
+                self.count('reviews')
+                label = item['sentiment']['S']
+                self.update(
+                    TableName=table_name,
+                    Key={'reviewerID': item['reviewerID'], 'reviewId': item['reviewId']},
+                    UpdateExpression='SET #k = :label',
+                    ConditionExpression='sentiment = :sent AND attribute_not_exists(#k)',
+                    ExpressionAttributeNames={'#k': SENTIMENT_KEY},
+                    ExpressionAttributeValues={
+                        ':label': {'S': sentiment_label(label, item['reviewId']['S'])},
+                        ':sent': {'S': label}
+                    }
+                )
+
+        values = {f':l{i}': {'S': label} for i, label in enumerate(LABELS)}
+        parallel_scan(dynamodb, table_name, handle_page, segments=segments, workers=workers,
+                      ProjectionExpression='reviewerID, reviewId, sentiment',
+                      FilterExpression=f"attribute_not_exists(#k) AND sentiment IN ({', '.join(values)})",
+                      ExpressionAttributeNames={'#k': SENTIMENT_KEY},
+                      ExpressionAttributeValues=values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add the sparse index keys to items stored before them")
+    parser.add_argument('--segments', type=int, default=8, help="parallel scan segments")
+    parser.add_argument('--workers', type=int, default=None, help="threads, default one per segment")
+    parser.add_argument('--dry-run', action='store_true', help="only count what would change")
+    args = parser.parse_args()
+
+    backfill = KeyBackfill(args.dry_run)
+    start = time.perf_counter()
+    backfill.users(table('users'), args.segments, args.workers)
+    backfill.reviews(table('reviews'), args.segments, args.workers)
+    elapsed = time.perf_counter() - start
+    print(dumps(dict(backfill.stats, seconds=round(elapsed, 2), dryRun=args.dry_run, **limiter.metrics())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import boto3
+from botocore.exceptions import ClientError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.compression import open_stream, stream_lines, zstandard
+
+# Compares reading the devset raw with reading it gzip/zstd compressed, the way
+# pre_process does: fetch, decompress while splitting lines, parse every line.
+#   python code/bench_compression.py data/reviews_devset.json --bandwidth 50
+#   python code/bench_compression.py data/reviews_devset.json --localstack
+# Without --localstack the fetch is modelled as size / bandwidth; with it the
+# three objects are uploaded to bench/ in a bucket of their own (reviews-bench,
+# created if missing) and fetched from S3. Not reviews-bucket: every object
+# created there triggers pre_process, which would ingest the devset three
+# times while it is being timed.
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+
+def parse(lines):
+    count = 0
+    for offset, line in lines:
+        if line.strip():
+            json.loads(line)
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raw vs compressed review ingestion")
+    parser.add_argument('filename', nargs='?', default='./data/test.json')
+    parser.add_argument('--bandwidth', type=float, default=50, help="modelled S3 throughput in MB/s")
+    parser.add_argument('--localstack', action='store_true', help="upload and fetch through LocalStack S3")
+    parser.add_argument('--bucket', default='reviews-bench', help="bucket for --localstack, must not be reviews-bucket")
+    args = parser.parse_args()
+
+    with open(args.filename, 'rb') as f:
+        raw = f.read()
+    variants = {None: raw, 'gzip': gzip.compress(raw, compresslevel=6)}
+    if zstandard is not None:
+        variants['zstd'] = zstandard.ZstdCompressor(level=3).compress(raw)
+    else:
+        print("zstandard not installed, skipping zstd")
+
+    s3 = boto3.client("s3", endpoint_url=endpoint_url) if args.localstack else None
+    if s3:
+        if args.bucket == 'reviews-bucket':
+            parser.error("reviews-bucket would ingest the benchmark objects, use another --bucket")
+        try:
+            s3.create_bucket(Bucket=args.bucket)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('BucketAlreadyOwnedByYou', 'BucketAlreadyExists'):
+                raise
+        for compression, data in variants.items():
+            s3.put_object(Bucket=args.bucket, Key=f"bench/devset.{compression or 'raw'}", Body=data)
+
+    for compression, data in variants.items():
+        start = time.perf_counter()
+        if s3:
+            body = s3.get_object(Bucket=args.bucket, Key=f"bench/devset.{compression or 'raw'}")['Body']
+            fetch = 0
+        else:
+            body = io.BytesIO(data)
+            fetch = len(data) / (args.bandwidth * 1024 * 1024)
+        tracemalloc.start()
+        count = parse(stream_lines(open_stream(body, compression)))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        elapsed = time.perf_counter() - start + fetch
+        print(f"{compression or 'raw':>5}: {len(data) / 1024 / 1024:7.2f} MB ({len(raw) / len(data):4.1f}x), "
+              f"{count} lines in {elapsed:.2f}s (fetch {fetch:.2f}s), peak {peak / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
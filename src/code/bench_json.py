@@ -0,0 +1,41 @@
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common import jsoncodec
+
+# Parse/serialize microbenchmark of common.jsoncodec over the devset lines,
+# with orjson and with the standard library fallback:
+#   python code/bench_json.py data/reviews_devset.json
+filename = sys.argv[1] if len(sys.argv) > 1 else './data/test.json'
+
+with open(filename, 'rb') as f:
+    lines = [line for line in f.read().splitlines() if line.strip()]
+
+
+def run(label):
+    start = time.perf_counter()
+    reviews = [jsoncodec.loads(line) for line in lines]
+    parsed = time.perf_counter() - start
+    start = time.perf_counter()
+    out = [jsoncodec.dumpb(review) for review in reviews]
+    serialized = time.perf_counter() - start
+    print(f"{label:>8}: loads {len(lines) / parsed:9.0f} lines/s, dumps {len(lines) / serialized:9.0f} lines/s")
+    return reviews, out
+
+
+orjson = jsoncodec.orjson
+if orjson is None:
+    print("orjson not installed, only the standard library is measured")
+    run('stdlib')
+else:
+    fast_reviews, fast_out = run('orjson')
+    jsoncodec.orjson = None
+    slow_reviews, slow_out = run('stdlib')
+    jsoncodec.orjson = orjson
+    # Both backends must agree, otherwise switching would change stored data
+    same_parse = fast_reviews == slow_reviews
+    same_output = sum(json.loads(a) == json.loads(b) for a, b in zip(fast_out, slow_out))
+    print(f"identical parse: {same_parse}, identical output: {same_output}/{len(lines)}")
@@ -0,0 +1,79 @@
+import json
+import os
+import random
+import re
+import sys
+import time
+
+from spellchecker import SpellChecker
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.spelling import SymSpell, load_frequencies
+
+# Compares the SymSpell engine against pyspellchecker on devset tokens:
+#   python code/bench_spelling.py [data/reviews_devset.json] [max tokens]
+filename = sys.argv[1] if len(sys.argv) > 1 else './data/test.json'
+limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+index_path = os.path.join('lambdas', 'pre_process', 'spelling_index.bin')
+
+tokens = []
+with open(filename, 'r', encoding='utf-8') as f:
+    for line in f:
+        review = json.loads(line)
+        tokens.extend(re.findall(r"[a-z]+", f"{review.get('reviewText', '')} {review.get('summary', '')}".lower()))
+        if len(tokens) >= limit:
+            break
+tokens = tokens[:limit]
+
+start = time.perf_counter()
+spell = SpellChecker()
+pyspell_setup = time.perf_counter() - start
+
+start = time.perf_counter()
+if os.path.exists(index_path):
+    symspell = SymSpell.load(index_path)
+else:
+    symspell = SymSpell.build(load_frequencies())
+symspell_setup = time.perf_counter() - start
+
+# The commented-out line in preprocess_text called correction twice per token
+start = time.perf_counter()
+expected = [spell.correction(word) if spell.correction(word) else word for word in tokens]
+pyspell_time = time.perf_counter() - start
+
+start = time.perf_counter()
+actual = symspell.correct_tokens(tokens)
+symspell_time = time.perf_counter() - start
+
+changed = [i for i, word in enumerate(tokens) if expected[i] != word]
+agree = sum(1 for i in range(len(tokens)) if expected[i] == actual[i])
+agree_changed = sum(1 for i in changed if expected[i] == actual[i])
+
+# Synthetic accuracy: common words with one random edit, does each engine recover them?
+random.seed(7)
+vocabulary = [word for word, _ in sorted(symspell.frequencies.items(), key=lambda item: -item[1])[:5000] if len(word) > 3]
+letters = 'abcdefghijklmnopqrstuvwxyz'
+pairs = []
+for word in random.sample(vocabulary, 500):
+    i = random.randrange(len(word))
+    edit = random.choice(['delete', 'insert', 'replace', 'transpose'])
+    if edit == 'delete':
+        typo = word[:i] + word[i + 1:]
+    elif edit == 'insert':
+        typo = word[:i] + random.choice(letters) + word[i:]
+    elif edit == 'replace':
+        typo = word[:i] + random.choice(letters) + word[i + 1:]
+    else:
+        i = min(i, len(word) - 2)
+        typo = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    pairs.append((typo, word))
+pyspell_accuracy = sum(1 for typo, word in pairs if (spell.correction(typo) or typo) == word) / len(pairs)
+symspell_accuracy = sum(1 for typo, word in pairs if symspell.correction(typo) == word) / len(pairs)
+
+print(f"Tokens: {len(tokens)} ({len(changed)} corrected by pyspellchecker)")
+print(f"pyspellchecker: setup {pyspell_setup:.2f}s, {pyspell_time:.2f}s, {len(tokens) / pyspell_time:.0f} tokens/s")
+print(f"symspell:       setup {symspell_setup:.2f}s, {symspell_time:.2f}s, {len(tokens) / symspell_time:.0f} tokens/s")
+print(f"Speedup: {pyspell_time / symspell_time:.1f}x")
+print(f"Agreement with pyspellchecker: {agree / len(tokens):.2%} of tokens, "
+      f"{agree_changed / len(changed) if changed else 1:.2%} of corrected tokens")
+print(f"Synthetic one-edit typos recovered: pyspellchecker {pyspell_accuracy:.2%}, symspell {symspell_accuracy:.2%}")
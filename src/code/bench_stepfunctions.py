@@ -0,0 +1,79 @@
+import json
+import os
+import sys
+import time
+import uuid
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.scan import parallel_scan
+
+# Compares one state machine execution per review with batched executions on
+# LocalStack (after setupnew.sh), over reviews already in the Reviews table:
+#   python code/bench_stepfunctions.py 500
+# Each run resets the reviews to unchecked/PENDING first. The users and
+# aggregate counters are incremented again on every run, so use a scratch stack.
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url, region_name="us-east-1")
+sfn = boto3.client("stepfunctions", endpoint_url=endpoint_url, region_name="us-east-1")
+state_machine_arn = next(
+    machine['stateMachineArn'] for machine in sfn.list_state_machines()['stateMachines']
+    if machine['name'] == 'review-state-machine'
+)
+
+
+def review_keys(limit):
+    keys = []
+    def collect(segment, page):
+        keys.extend({'reviewerID': item['reviewerID']['S'], 'reviewId': item['reviewId']['S']} for item in page['Items'])
+    parallel_scan(dynamodb, 'Reviews', collect, ProjectionExpression='reviewerID, reviewId')
+    return keys[:limit]
+
+
+def reset(keys):
+    for key in keys:
+        dynamodb.update_item(
+            TableName='Reviews',
+            Key={'reviewerID': {'S': key['reviewerID']}, 'reviewId': {'S': key['reviewId']}},
+            UpdateExpression='SET sentiment = :pending REMOVE profanityChecked',
+            ExpressionAttributeValues={':pending': {'S': 'PENDING'}}
+        )
+
+
+def run(keys, batch_size, max_batches=40):
+    batches = [{'reviews': keys[i:i + batch_size]} for i in range(0, len(keys), batch_size)]
+    start = time.perf_counter()
+    executions = []
+    for i in range(0, len(batches), max_batches):
+        executions.append(sfn.start_execution(
+            stateMachineArn=state_machine_arn,
+            name=str(uuid.uuid4()),
+            input=json.dumps({'batches': batches[i:i + max_batches]})
+        )['executionArn'])
+    started = time.perf_counter() - start
+
+    statuses = {}
+    pending = list(executions)
+    while pending:
+        time.sleep(0.5)
+        still_running = []
+        for arn in pending:
+            status = sfn.describe_execution(executionArn=arn)['status']
+            if status == 'RUNNING':
+                still_running.append(arn)
+            else:
+                statuses[status] = statuses.get(status, 0) + 1
+        pending = still_running
+    return len(executions), started, time.perf_counter() - start, statuses
+
+
+keys = review_keys(count)
+print(f"{len(keys)} reviews")
+# batch size 1 with one batch per execution is the old per-review workflow
+for label, batch_size, max_batches in (('per review', 1, 1), ('batch 10', 10, 40), ('batch 25', 25, 40), ('batch 100', 100, 40)):
+    reset(keys)
+    executions, started, elapsed, statuses = run(keys, batch_size, max_batches)
+    print(f"{label:>10}: {executions} executions started in {started:.2f}s, done in {elapsed:.2f}s "
+          f"({len(keys) / elapsed:.0f} reviews/s) {statuses}")
@@ -0,0 +1,40 @@
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas', 'pre_process'))
+import pre_process
+
+# Runs the pre_process write stage against a stand-in DynamoDB client that
+# sleeps for a fixed round trip, comparing writer concurrency levels:
+#   python code/bench_write_pipeline.py data/reviews_devset.json 20
+filename = sys.argv[1] if len(sys.argv) > 1 else './data/test.json'
+latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+
+
+class LatencyClient:
+    def transact_write_items(self, **kwargs):
+        time.sleep(latency)
+        return {}
+
+
+with open(filename, 'rb') as f:
+    lines = list(pre_process.split_lines(f.read()))
+
+pre_process.dynamodb = LatencyClient()
+tables = {'reviews': 'Reviews', 'aggregates': 'Aggregates'}
+
+# Warm the text cache so every run below measures the write stage, not NLP
+asyncio.run(pre_process.ingest_lines(lines, tables, concurrency=32))
+
+baseline = None
+for concurrency in (1, 4, 16, 32, 64):
+    start = time.perf_counter()
+    stats = asyncio.run(pre_process.ingest_lines(lines, tables, concurrency=concurrency))
+    elapsed = time.perf_counter() - start
+    baseline = baseline or elapsed
+    print(f"concurrency {concurrency:>3}: {stats['written']} writes in {elapsed:.2f}s "
+          f"({stats['written'] / elapsed:.0f} writes/s, {baseline / elapsed:.1f}x)")
@@ -0,0 +1,17 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.spelling import SymSpell, load_frequencies
+
+# Precomputes the symmetric-delete index shipped with pre_process so cold starts
+# only load it. Run with the same Python version as the Lambda runtime:
+#   python code/build_spelling_index.py lambdas/pre_process/spelling_index.bin
+target = sys.argv[1] if len(sys.argv) > 1 else os.path.join('lambdas', 'pre_process', 'spelling_index.bin')
+
+start = time.perf_counter()
+spell = SymSpell.build(load_frequencies())
+spell.save(target)
+print(f"Indexed {len(spell.frequencies)} words into {len(spell.index)} deletes "
+      f"in {time.perf_counter() - start:.1f}s -> {target} ({os.path.getsize(target) / 1e6:.1f} MB)")
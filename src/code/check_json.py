@@ -1,23 +1,168 @@
-import json
+import argparse
+import math
+import os
+import sys
+from multiprocessing import Pool
 
-filename = './data/reviews_devset.json'  # replace with your actual file path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.jsoncodec import dumps, loads
 
-with open(filename, 'r', encoding='utf-8') as f:
-    data = [json.loads(line) for line in f]
+# Pre-ingest check of a review dump against the fields pre_process relies on.
+# The file is split into byte ranges that are validated in parallel, one line
+# at a time, so memory stays flat whatever the file size:
+#   python code/check_json.py data/reviews_devset.json
+#   python code/check_json.py data/reviews_devset.json --workers 8 --show 50
+# Exits with status 1 when any line is invalid. A missing or NaN `overall` is
+# only a warning: pre_process stores such reviews without a rating.
+TEXT_FIELDS = ('reviewerID', 'asin', 'reviewText', 'summary')
+REQUIRED_TEXT = ('reviewerID', 'asin')
+WARNINGS = ('overall: missing', 'overall: NaN')
 
-print("Keys of the first JSON object:")
-print(data[0].keys())
 
-# Check if 'overall' is a number between 0 and 5.0 in all records
-invalid_entries = []
-for i, item in enumerate(data):
-    overall = item.get('overall')
-    if not isinstance(overall, (int, float)) or not (0 <= overall <= 5.0):
-        invalid_entries.append((i, overall))
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
 
-if invalid_entries:
-    print("\nInvalid 'overall' entries found:")
-    for idx, val in invalid_entries:
-        print(f"Line {idx + 1}: overall = {val}")
-else:
-    print("\nAll 'overall' values are valid numbers between 0 and 5.0.")
+
+def check_review(review):
+    if not isinstance(review, dict):
+        return ['not an object']
+    problems = []
+    for field in TEXT_FIELDS:
+        value = review.get(field)
+        if value is None:
+            problems.append(f'{field}: missing')
+        elif not isinstance(value, str):
+            problems.append(f'{field}: not a string')
+        elif field in REQUIRED_TEXT and not value.strip():
+            problems.append(f'{field}: empty')
+    value = review.get('unixReviewTime')
+    if value is None:
+        problems.append('unixReviewTime: missing')
+    elif not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        problems.append('unixReviewTime: not a positive integer')
+    value = review.get('overall')
+    if value is None:
+        problems.append('overall: missing')
+    elif isinstance(value, float) and math.isnan(value):
+        problems.append('overall: NaN')
+    elif not is_number(value) or not math.isfinite(value):
+        problems.append('overall: not a number')
+    elif not 0 <= value <= 5.0:
+        problems.append('overall: out of range')
+    return problems
+
+
+def new_stats():
+    return {
+        'lines': 0, 'blank': 0, 'invalid': 0, 'problems': {}, 'warnings': {}, 'examples': [],
+        'overall': {}, 'minTime': None, 'maxTime': None,
+        'textChars': 0, 'maxTextChars': 0, 'emptyText': 0
+    }
+
+
+def check_range(args):
+    # Validates the lines that start inside [start, end) of the file
+    filename, start, end, show = args
+    stats = new_stats()
+    with open(filename, 'rb') as f:
+        if start > 0:
+            # Skip the line that began before this range; it belongs to the previous one
+            f.seek(start - 1)
+            f.readline()
+        offset = f.tell()
+        while offset < end:
+            line = f.readline()
+            if not line:
+                break
+            line_offset, offset = offset, offset + len(line)
+            if not line.strip():
+                stats['blank'] += 1
+                continue
+            stats['lines'] += 1
+            try:
+                review = loads(line)
+            except ValueError:
+                problems = ['invalid JSON']
+            else:
+                problems = check_review(review)
+            for warning in [problem for problem in problems if problem in WARNINGS]:
+                stats['warnings'][warning] = stats['warnings'].get(warning, 0) + 1
+                problems.remove(warning)
+            if problems:
+                stats['invalid'] += 1
+                for problem in problems:
+                    stats['problems'][problem] = stats['problems'].get(problem, 0) + 1
+                if len(stats['examples']) < show:
+                    stats['examples'].append((line_offset, problems, line[:120].decode('utf-8', errors='replace')))
+                continue
+            overall = review.get('overall')
+            overall = str(overall) if is_number(overall) and math.isfinite(overall) else 'none'
+            stats['overall'][overall] = stats['overall'].get(overall, 0) + 1
+            review_time = review['unixReviewTime']
+            stats['minTime'] = review_time if stats['minTime'] is None else min(stats['minTime'], review_time)
+            stats['maxTime'] = review_time if stats['maxTime'] is None else max(stats['maxTime'], review_time)
+            chars = len(review['reviewText'])
+            stats['textChars'] += chars
+            stats['maxTextChars'] = max(stats['maxTextChars'], chars)
+            if not review['reviewText'].strip():
+                stats['emptyText'] += 1
+    return stats
+
+
+def merge(total, stats):
+    for field in ('lines', 'blank', 'invalid', 'textChars', 'emptyText'):
+        total[field] += stats[field]
+    for field in ('problems', 'warnings', 'overall'):
+        for key, count in stats[field].items():
+            total[field][key] = total[field].get(key, 0) + count
+    total['examples'].extend(stats['examples'])
+    total['maxTextChars'] = max(total['maxTextChars'], stats['maxTextChars'])
+    for field, pick in (('minTime', min), ('maxTime', max)):
+        if stats[field] is not None:
+            total[field] = stats[field] if total[field] is None else pick(total[field], stats[field])
+
+
+def validate(filename, workers=None, chunk_bytes=16 * 1024 * 1024, show=20):
+    size = os.path.getsize(filename)
+    ranges = [(filename, start, min(start + chunk_bytes, size), show) for start in range(0, size, chunk_bytes)]
+    total = new_stats()
+    with Pool(workers or os.cpu_count()) as pool:
+        for stats in pool.imap_unordered(check_range, ranges):
+            merge(total, stats)
+    total['examples'] = sorted(total['examples'])[:show]
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate a review dump before uploading it")
+    parser.add_argument('filename', nargs='?', default='./data/reviews_devset.json')
+    parser.add_argument('--workers', type=int, default=None, help="processes, default one per core")
+    parser.add_argument('--chunk-mb', type=int, default=16, help="size of the byte range per task")
+    parser.add_argument('--show', type=int, default=20, help="invalid lines to print")
+    args = parser.parse_args()
+
+    total = validate(args.filename, args.workers, args.chunk_mb * 1024 * 1024, args.show)
+    valid = total['lines'] - total['invalid']
+    print(f"{total['lines']} lines, {valid} valid, {total['invalid']} invalid, {total['blank']} blank")
+    if total['problems']:
+        print("\nProblems:")
+        for problem, count in sorted(total['problems'].items(), key=lambda item: -item[1]):
+            print(f"  {problem}: {count}")
+        print("\nFirst invalid lines (byte offset):")
+        for offset, problems, text in total['examples']:
+            print(f"  {offset}: {', '.join(problems)} | {text}")
+    if total['warnings']:
+        print("\nWarnings (lines still valid):")
+        for warning, count in sorted(total['warnings'].items(), key=lambda item: -item[1]):
+            print(f"  {warning}: {count}")
+    print("\nField statistics of valid lines:")
+    print(f"  overall: {dumps(dict(sorted(total['overall'].items())))}")
+    print(f"  unixReviewTime: {total['minTime']} .. {total['maxTime']}")
+    if valid:
+        print(f"  reviewText: {total['textChars'] / valid:.0f} chars on average, "
+              f"{total['maxTextChars']} max, {total['emptyText']} empty")
+    sys.exit(1 if total['invalid'] else 0)
+
+
+if __name__ == "__main__":
+    main()
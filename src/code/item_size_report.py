@@ -0,0 +1,35 @@
+import json
+import math
+import os
+import sys
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas', 'pre_process'))
+import pre_process
+from common.text_codec import item_size
+
+# Item size and write units of Reviews items with plain vs compact processed text:
+#   python code/item_size_report.py data/reviews_devset.json
+filename = sys.argv[1] if len(sys.argv) > 1 else './data/test.json'
+
+totals = {False: [0, 0], True: [0, 0]}  # compact -> [bytes, WCU]
+items = 0
+with open(filename, 'r', encoding='utf-8') as f:
+    for line in f:
+        if not line.strip():
+            continue
+        review_data = json.loads(line)
+        for compact in (False, True):
+            pre_process.compact_text = compact
+            size = item_size(pre_process.build_item(review_data))
+            totals[compact][0] += size
+            totals[compact][1] += math.ceil(size / 1024)
+        items += 1
+
+plain_bytes, plain_wcu = totals[False]
+compact_bytes, compact_wcu = totals[True]
+print(f"Items: {items}")
+print(f"Plain:   {plain_bytes} bytes ({plain_bytes / items:.0f} avg), {plain_wcu} WCU")
+print(f"Compact: {compact_bytes} bytes ({compact_bytes / items:.0f} avg), {compact_wcu} WCU")
+print(f"Reduction: {1 - compact_bytes / plain_bytes:.1%} bytes, {1 - compact_wcu / plain_wcu:.1%} WCU")
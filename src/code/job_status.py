@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.jobs import get_job, job_id, wait_for_job
+
+# Progress of an uploaded object through pre-process, profanity and sentiment:
+#   python code/job_status.py reviews_devset.json
+#   python code/job_status.py reviews_devset.json --wait --timeout 600
+# The job of the object's current content is found through its ETag. --wait
+# returns as soon as every stage has processed all expected reviews and exits
+# with status 1 on timeout.
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+ssm = boto3.client("ssm", endpoint_url=endpoint_url)
+s3 = boto3.client("s3", endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show or wait for the ingest job of an uploaded object")
+    parser.add_argument('key', help="object key in the reviews bucket")
+    parser.add_argument('--wait', action='store_true', help="block until the job is complete")
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    bucket = ssm.get_parameter(Name='/review-app/buckets/reviews')['Parameter']['Value']
+    table = ssm.get_parameter(Name='/review-app/tables/jobs')['Parameter']['Value']
+    job = job_id(args.key, s3.head_object(Bucket=bucket, Key=args.key)['ETag'])
+
+    if not args.wait:
+        print(json.dumps(get_job(dynamodb, table, job)))
+        return
+    start = time.perf_counter()
+    try:
+        result = wait_for_job(dynamodb, table, job, timeout=args.timeout)
+    except TimeoutError as e:
+        print(e)
+        sys.exit(1)
+    print(json.dumps(result))
+    print(f"complete after {time.perf_counter() - start:.1f}s of waiting")
+
+
+if __name__ == "__main__":
+    main()
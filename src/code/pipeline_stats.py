@@ -0,0 +1,24 @@
+import json
+import os
+import sys
+
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.aggregates import read_aggregates
+
+# Reads the counters maintained by the handlers instead of scanning the tables:
+#   python code/pipeline_stats.py
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+ssm = boto3.client("ssm", endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url)
+
+
+def get_pipeline_stats():
+    table = ssm.get_parameter(Name='/review-app/tables/aggregates')['Parameter']['Value']
+    return read_aggregates(dynamodb, table)
+
+
+if __name__ == "__main__":
+    print(json.dumps(get_pipeline_stats(), indent=2))
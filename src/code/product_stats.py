@@ -0,0 +1,25 @@
+import json
+import os
+import sys
+
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.product_stats import get_product_stats
+
+# Summary of one product from the ProductStats table, a single BatchGetItem over its shards:
+#   python code/product_stats.py B00002N66D
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+ssm = boto3.client("ssm", endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url)
+
+
+def lookup(asin):
+    table = ssm.get_parameter(Name='/review-app/tables/products')['Parameter']['Value']
+    return get_product_stats(dynamodb, table, asin)
+
+
+if __name__ == "__main__":
+    for asin in sys.argv[1:]:
+        print(json.dumps(lookup(asin), indent=2))
@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import sys
+
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.queries import (BANNED_FLAG, BANNED_INDEX, banned_users, profane_reviews, query_count,
+                            reviews_by_sentiment, sentiment_count)
+from common.text_codec import readable_item
+
+# Index lookups replacing the filtered scans in commands.txt, e.g.
+#   python code/query_reviews.py sentiment NEGATIVE --limit 10
+#   python code/query_reviews.py sentiment POSITIVE --count
+#   python code/query_reviews.py profane --reviewer A2VNYWOPJ13AFP
+#   python code/query_reviews.py banned
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+ssm = boto3.client("ssm", endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url)
+
+
+def table(name):
+    return ssm.get_parameter(Name=f'/review-app/tables/{name}')['Parameter']['Value']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the review indexes")
+    parser.add_argument('command', choices=['sentiment', 'profane', 'banned'])
+    parser.add_argument('label', nargs='?', help="sentiment label, e.g. NEGATIVE")
+    parser.add_argument('--reviewer', help="profane reviews of this reviewer only")
+    parser.add_argument('--limit', type=int, default=None, help="stop after this many items")
+    parser.add_argument('--count', action='store_true', help="only count the matches")
+    args = parser.parse_args()
+
+    if args.command == 'sentiment':
+        if not args.label:
+            parser.error("sentiment needs a label")
+        if args.count:
+            print(sentiment_count(dynamodb, table('reviews'), args.label.upper()))
+            return
+        items = reviews_by_sentiment(dynamodb, table('reviews'), args.label.upper())
+    elif args.command == 'profane':
+        items = profane_reviews(dynamodb, table('reviews'), args.reviewer)
+    else:
+        if args.count:
+            print(query_count(dynamodb, table('users'), BANNED_INDEX, 'bannedFlag', BANNED_FLAG))
+            return
+        items = banned_users(dynamodb, table('users'))
+
+    count = 0
+    for item in items:
+        if args.limit is not None and count >= args.limit:
+            break
+        count += 1
+        if not args.count:
+            print(json.dumps(readable_item(item)))
+    if args.count:
+        print(count)
+
+
+if __name__ == "__main__":
+    main()
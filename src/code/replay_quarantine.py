@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import sys
+
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.quarantine import load_quarantined
+
+# Inspects and replays the lines pre-process quarantined, e.g.
+#   python code/replay_quarantine.py list
+#   python code/replay_quarantine.py replay --key test2.json
+# Replay runs inside the pre-process function, so only the quarantined lines
+# are reprocessed, with the deployed NLP and configuration.
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+ssm = boto3.client("ssm", endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url)
+lambda_client = boto3.client("lambda", endpoint_url=endpoint_url)
+
+
+def list_quarantined(source_key=None, verbose=False):
+    table = ssm.get_parameter(Name='/review-app/tables/quarantine')['Parameter']['Value']
+    entries = load_quarantined(dynamodb, table, source_key)
+    summary = {}
+    for entry in entries:
+        counts = summary.setdefault(entry['sourceKey'], {})
+        counts[entry['stage']] = counts.get(entry['stage'], 0) + 1
+        if verbose:
+            print(f"{entry['sourceKey']}@{entry['offset']} [{entry['stage']}, attempt {entry['attempts']}] {entry['error']}")
+    return summary
+
+
+def replay(source_key=None, function_name='pre-process'):
+    response = lambda_client.invoke(
+        FunctionName=function_name,
+        Payload=json.dumps({'replay': {'sourceKey': source_key}})
+    )
+    return json.loads(response['Payload'].read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and replay quarantined review lines")
+    parser.add_argument('command', choices=['list', 'replay'])
+    parser.add_argument('--key', help="only lines from this source object")
+    parser.add_argument('--function', default='pre-process', help="pre-process function name")
+    parser.add_argument('--verbose', action='store_true', help="list every quarantined line")
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        print(json.dumps(list_quarantined(args.key, args.verbose), indent=2))
+    else:
+        print(json.dumps(replay(args.key, args.function), indent=2))
+
+
+if __name__ == "__main__":
+    main()
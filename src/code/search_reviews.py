@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import sys
+
+import boto3
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas', 'pre_process'))
+from common.batch import batch_get
+from common.search import review_key, search
+from common.text_codec import readable_item
+
+# Keyword search over the processed (lemmatized) review text, e.g.
+#   python code/search_reviews.py battery broken            reviews with both
+#   python code/search_reviews.py battery charger --any     reviews with either
+#   python code/search_reviews.py battery --cursor <last id of previous page>
+# The terms go through pre_process's tokenizer, stopwords and lemmatizer, so
+# "batteries" finds the reviews indexed under "battery". Set SPELL_CORRECTION
+# as on the deployed pre_process function when it corrects spelling.
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+ssm = boto3.client("ssm", endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url)
+
+
+def table(name):
+    return ssm.get_parameter(Name=f'/review-app/tables/{name}')['Parameter']['Value']
+
+
+def analyze(terms):
+    # Imported here: loading the NLP models takes a few seconds
+    import pre_process
+    return [token for term in terms for token in pre_process.run_nlp(term).split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search reviews by lemma")
+    parser.add_argument('terms', nargs='+')
+    parser.add_argument('--any', action='store_true', help="match any term instead of all of them")
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--cursor', help="continue after this reviewId")
+    parser.add_argument('--show', action='store_true', help="print the matching reviews, not only their ids")
+    args = parser.parse_args()
+
+    terms = analyze(args.terms)
+    if not terms:
+        parser.error("only stopwords given, nothing to search for")
+    ids, cursor = search(dynamodb, table('search'), terms, 'any' if args.any else 'all', args.limit, args.cursor)
+    if args.show and ids:
+        items = {item['reviewId']['S']: item
+                 for item in batch_get(dynamodb, table('reviews'), [review_key(i) for i in ids])}
+        for review_id in ids:
+            if review_id in items:
+                print(json.dumps(readable_item(items[review_id])))
+    else:
+        for review_id in ids:
+            print(review_id)
+    print(f"next cursor: {cursor}" if cursor else "no more results")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import calendar
+import os
+import sys
+import time
+
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.sketches import compact, current_window, merged_sketch
+
+# Approximate dashboard numbers from the Sketches table, merged from the
+# per-invocation parts of each day without touching Reviews or Users:
+#   python code/sketch_report.py
+#   python code/sketch_report.py --days 7 --top 20
+#   python code/sketch_report.py --compact
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+ssm = boto3.client("ssm", endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url)
+
+LABELS = ('POSITIVE', 'NEUTRAL', 'NEGATIVE')
+NAMES = ['reviewers', 'profane-terms'] + [f'lemmas-{label}' for label in LABELS]
+
+
+def windows(days):
+    today = calendar.timegm(time.strptime(current_window(), '%Y-%m-%d'))
+    return [time.strftime('%Y-%m-%d', time.gmtime(today - day * 86400)) for day in range(days)][::-1]
+
+
+def merge_days(table, days, name):
+    merged = None
+    for window in days:
+        sketch = merged_sketch(dynamodb, table, window, name)
+        if sketch is None:
+            continue
+        if merged is None:
+            merged = sketch
+        else:
+            merged.merge(sketch)
+    return merged
+
+
+def print_terms(title, sketch, top):
+    print(f"\n{title}:")
+    if sketch is None:
+        print("  (none)")
+        return
+    for term, count in sketch.heavy_hitters(top):
+        print(f"  {term:<24} ~{count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the streaming sketches")
+    parser.add_argument('--days', type=int, default=1, help="number of days up to today")
+    parser.add_argument('--top', type=int, default=10, help="terms to show per list")
+    parser.add_argument('--compact', action='store_true', help="merge each day's parts into one item first")
+    args = parser.parse_args()
+
+    table = ssm.get_parameter(Name='/review-app/tables/sketches')['Parameter']['Value']
+    days = windows(args.days)
+    if args.compact:
+        for window in days:
+            for name in NAMES:
+                parts = compact(dynamodb, table, window, name)
+                if parts > 1:
+                    print(f"{window} {name}: {parts} parts compacted")
+
+    print("Distinct reviewers per day:")
+    for window in days:
+        sketch = merged_sketch(dynamodb, table, window, 'reviewers')
+        print(f"  {window}: ~{sketch.count() if sketch else 0}")
+    if len(days) > 1:
+        sketch = merge_days(table, days, 'reviewers')
+        print(f"  all {len(days)} days: ~{sketch.count() if sketch else 0}")
+
+    print_terms("Top profane terms", merge_days(table, days, 'profane-terms'), args.top)
+    for label in LABELS:
+        print_terms(f"Top {label.lower()} lemmas", merge_days(table, days, f'lemmas-{label}'), args.top)
+
+
+if __name__ == "__main__":
+    main()
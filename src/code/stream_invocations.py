@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+import time
+
+import boto3
+
+# Counts stream consumer invocations from their CloudWatch logs, split into
+# invocations that had new reviews to work on and ones that only carried
+# MODIFY/REMOVE records. Compare a run before and after the filter criteria:
+#   python code/stream_invocations.py [minutes back]
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+minutes = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+
+logs = boto3.client("logs", endpoint_url=endpoint_url)
+
+
+def batch_lines(function_name, since):
+    paginator = logs.get_paginator('filter_log_events')
+    for page in paginator.paginate(logGroupName=f'/aws/lambda/{function_name}', startTime=since):
+        for event in page['events']:
+            message = event['message'].strip()
+            if message.startswith('{"streamBatch"'):
+                yield json.loads(message)
+
+
+since = int((time.time() - minutes * 60) * 1000)
+for function_name in ('profanity', 'sentiment'):
+    invocations = records = inserts = wasted = 0
+    for line in batch_lines(function_name, since):
+        invocations += 1
+        records += line['records']
+        inserts += line['inserts']
+        if not line['inserts']:
+            wasted += 1
+    print(f"{function_name}: {invocations} invocations, {records} records, {inserts} inserts, "
+          f"{wasted} invocations without new reviews")
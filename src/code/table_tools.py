@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import boto3
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambdas'))
+from common.scan import bulk_delete, parallel_count, parallel_scan
+from common.text_codec import readable_item
+
+# Parallel scan tooling for resetting and inspecting the tables, e.g.
+#   python code/table_tools.py count Reviews
+#   python code/table_tools.py delete Reviews --segments 16
+#   python code/table_tools.py export Reviews reviews.jsonl --projection "reviewId, sentiment"
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+dynamodb = boto3.client("dynamodb", endpoint_url=endpoint_url)
+
+
+def export_table(table_name, path, segments, workers, projection=None):
+    # Items are written as DynamoDB JSON, one per line, in scan order per segment
+    lock = threading.Lock()
+    scan_kwargs = {'ProjectionExpression': projection} if projection else {}
+    with open(path, 'w', encoding='utf-8') as out:
+        def write_page(segment, page):
+            lines = ''.join(json.dumps(readable_item(item)) + '\n' for item in page['Items'])
+            with lock:
+                out.write(lines)
+
+        return parallel_scan(dynamodb, table_name, write_page, segments=segments, workers=workers, **scan_kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel scan tooling for the review tables")
+    parser.add_argument('command', choices=['count', 'delete', 'export'])
+    parser.add_argument('table')
+    parser.add_argument('output', nargs='?', help="target file for export")
+    parser.add_argument('--segments', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--projection', default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'count':
+        items = parallel_count(dynamodb, args.table, segments=args.segments, workers=args.workers)
+    elif args.command == 'delete':
+        items = bulk_delete(dynamodb, args.table, segments=args.segments, workers=args.workers)
+    else:
+        if not args.output:
+            parser.error("export needs an output file")
+        items = export_table(args.table, args.output, args.segments, args.workers, args.projection)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.command} {args.table}: {items} items in {elapsed:.2f}s "
+          f"({items / elapsed if elapsed else 0:.0f} items/s, {args.segments} segments)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import boto3
+
+# Latency report built from the span lines the stages log (common/tracing.py):
+#   python code/trace_report.py --fetch 60
+#   python code/trace_report.py pre-process.log profanity.log sentiment.log
+# --fetch reads the last N minutes of the functions' CloudWatch logs; files
+# (or - for stdin) may hold raw log output, one span per line anywhere in it.
+# Times are per review, from the upload of its object until a stage was done
+# with it; end to end is the latest stage of every review seen by all stages.
+endpoint_url = os.getenv("AWS_ENDPOINT_URL", "http://localhost.localstack.cloud:4566")
+
+LOG_GROUPS = [
+    '/aws/lambda/pre-process', '/aws/lambda/pre_process', '/aws/lambda/profanity', '/aws/lambda/sentiment',
+    '/aws/lambda/preprocessing-function', '/aws/lambda/profanity-check-function',
+    '/aws/lambda/sentiment-analysis-function'
+]
+# The stage that writes the review; the others are measured from it
+INGEST_STAGES = ('pre_process', 'preprocessing')
+BUCKETS_MS = [100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, 120000, 300000, 600000, 1800000]
+
+
+def parse_spans(lines):
+    for line in lines:
+        start = line.find('{"span"')
+        if start == -1:
+            continue
+        try:
+            yield json.loads(line[start:])
+        except ValueError:
+            continue
+
+
+def fetch_lines(minutes, groups):
+    logs = boto3.client("logs", endpoint_url=endpoint_url)
+    since = int((time.time() - minutes * 60) * 1000)
+    for group in groups:
+        paginator = logs.get_paginator('filter_log_events')
+        try:
+            for page in paginator.paginate(logGroupName=group, startTime=since, filterPattern='"span"'):
+                for event in page['events']:
+                    yield event['message']
+        except logs.exceptions.ResourceNotFoundException:
+            continue
+
+
+def file_lines(paths):
+    for path in paths:
+        if path == '-':
+            yield from sys.stdin
+        else:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                yield from f
+
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def seconds(ms):
+    return f"{ms / 1000:.2f}s"
+
+
+def summary(values):
+    values = sorted(values)
+    if not values:
+        return "no data"
+    return (f"n={len(values):<7} p50 {seconds(percentile(values, 0.5)):>9}  p90 {seconds(percentile(values, 0.9)):>9}  "
+            f"p99 {seconds(percentile(values, 0.99)):>9}  max {seconds(values[-1]):>9}")
+
+
+def histogram(values, width=40):
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for value in values:
+        counts[next((i for i, bound in enumerate(BUCKETS_MS) if value < bound), len(BUCKETS_MS))] += 1
+    peak = max(counts) or 1
+    labels = [f"< {seconds(bound)}" for bound in BUCKETS_MS] + [f">= {seconds(BUCKETS_MS[-1])}"]
+    for label, count in zip(labels, counts):
+        if count:
+            print(f"  {label:>12} {count:>8} {'#' * max(1, count * width // peak)}")
+
+
+def report(spans):
+    stages = {}
+    traces = {}
+    for span in spans:
+        stage = stages.setdefault(span['span'], {'batches': 0, 'durations': [], 'latencies': []})
+        stage['batches'] += 1
+        stage['durations'].append(span['durationMs'])
+        for trace_id, since_upload in span['reviews']:
+            stage['latencies'].append(since_upload)
+            seen = traces.setdefault(trace_id, {})
+            # A review reported twice (a retried batch) counts when it was first done
+            seen[span['span']] = min(since_upload, seen.get(span['span'], since_upload))
+
+    if not stages:
+        print("No span lines found")
+        return
+    print("Per stage, time from upload until the stage finished a review:")
+    for name, stage in stages.items():
+        print(f"  {name:<30} {summary(stage['latencies'])}")
+    print("\nPer stage, duration of one batch (invocation):")
+    for name, stage in stages.items():
+        print(f"  {name:<30} {summary(stage['durations'])}  ({stage['batches']} batches)")
+
+    print("\nBreakdown per review:")
+    for name in stages:
+        if name in INGEST_STAGES:
+            label = f"upload -> {name}"
+            print(f"  {label:<30} {summary([seen[name] for seen in traces.values() if name in seen])}")
+    for ingest in (name for name in stages if name in INGEST_STAGES):
+        for name in stages:
+            if name in INGEST_STAGES:
+                continue
+            deltas = [seen[name] - seen[ingest] for seen in traces.values() if name in seen and ingest in seen]
+            if deltas:
+                label = f"{ingest} -> {name}"
+                print(f"  {label:<30} {summary(deltas)}")
+
+    stage_count = max(len(seen) for seen in traces.values())
+    complete = [max(seen.values()) for seen in traces.values()
+                if len(seen) == stage_count and any(name in seen for name in INGEST_STAGES)]
+    print(f"\nEnd to end, upload until the last stage ({len(complete)} of {len(traces)} reviews seen by every stage):")
+    print(f"  {'':<30} {summary(complete)}")
+    histogram(complete)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end latency report from the pipeline's span logs")
+    parser.add_argument('files', nargs='*', help="log files, - for stdin")
+    parser.add_argument('--fetch', type=int, metavar='MINUTES', help="read the CloudWatch logs instead")
+    parser.add_argument('--group', action='append', help="log group to read, default all pipeline functions")
+    args = parser.parse_args()
+
+    if args.fetch is not None:
+        lines = fetch_lines(args.fetch, args.group or LOG_GROUPS)
+    elif args.files:
+        lines = file_lines(args.files)
+    else:
+        parser.error("give log files or --fetch")
+    report(parse_spans(lines))
+
+
+if __name__ == "__main__":
+    main()
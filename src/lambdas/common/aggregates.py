@@ -0,0 +1,52 @@
+import random
+
+# Counters live in sharded items so that every handler bumping them does not
+# hammer a single partition key, and the review transactions that include them
+# rarely conflict on the same shard. Readers sum all shards.
+SHARDS = 32
+AGGREGATE_NAME = 'pipeline'
+COUNTERS = ('ingested', 'positive', 'neutral', 'negative', 'profane', 'banned', 'skipped')
+
+
+def shard_key(shard):
+    return {'aggregate': {'S': f"{AGGREGATE_NAME}#{shard}"}}
+
+
+def add_update(table_name, key, counters):
+    # Atomic ADD of every counter on one item. The result is an Update action
+    # usable both with update_item and inside transact_write_items.
+    names = {}
+    values = {}
+    adds = []
+    for i, (counter, amount) in enumerate(sorted(counters.items())):
+        names[f'#c{i}'] = counter
+        values[f':c{i}'] = {'N': str(amount)}
+        adds.append(f'#c{i} :c{i}')
+    return {
+        'TableName': table_name,
+        'Key': key,
+        'UpdateExpression': 'ADD ' + ', '.join(adds),
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+
+
+def counter_update(table_name, counters):
+    return add_update(table_name, shard_key(random.randrange(SHARDS)), counters)
+
+
+def increment(dynamodb, table_name, **counters):
+    dynamodb.update_item(**counter_update(table_name, counters))
+
+
+def read_aggregates(dynamodb, table_name):
+    totals = dict.fromkeys(COUNTERS, 0)
+    request = {table_name: {'Keys': [shard_key(s) for s in range(SHARDS)], 'ConsistentRead': True}}
+    while request:
+        response = dynamodb.batch_get_item(RequestItems=request)
+        for item in response['Responses'].get(table_name, []):
+            for counter in COUNTERS:
+                if counter in item:
+                    totals[counter] += int(item[counter]['N'])
+        request = response.get('UnprocessedKeys')
+    return totals
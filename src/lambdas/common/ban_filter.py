@@ -0,0 +1,121 @@
+import hashlib
+import math
+import threading
+import time
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from common.queries import banned_users
+
+# Banned reviewers are few compared to all reviewers, and every review in
+# pre_process has to be checked. A Bloom filter answers "definitely not banned"
+# from memory; only the rare positive (banned or a false positive) costs a
+# get_item to confirm.
+# The filter fails open: if BannedIndex cannot be read (e.g. a Users table
+# created before the index existed), the error is logged, the previous filter
+# (or none, so nobody is banned) is kept and the refresh is retried after
+# refresh_seconds. A ban check must not turn every review into a failure.
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+def load_banned(dynamodb, table_name):
+    # Reads the sparse BannedIndex, so the cost follows the number of banned
+    # users rather than the size of Users
+    return [item['reviewerID']['S'] for item in banned_users(dynamodb, table_name)]
+
+
+class BanFilter:
+    def __init__(self, dynamodb, table_name, refresh_seconds=300, error_rate=0.01):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.refresh_seconds = refresh_seconds
+        self.error_rate = error_rate
+        self.filter = None
+        self.loaded_at = 0
+        # Confirmed answers for positives of the current filter, dropped on refresh
+        self.confirmed = {}
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.checks = 0
+        self.lookups = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    def refresh(self):
+        try:
+            banned = load_banned(self.dynamodb, self.table_name)
+        except (BotoCoreError, ClientError) as e:
+            print(f"Could not load banned users from {self.table_name}, retrying in {self.refresh_seconds}s: {e}")
+            with self.lock:
+                if self.filter is None:
+                    self.filter = BloomFilter(0, self.error_rate)
+                self.loaded_at = time.monotonic()
+                self.errors += 1
+            return
+        bloom = BloomFilter(len(banned), self.error_rate)
+        for reviewer_id in banned:
+            bloom.add(reviewer_id)
+        with self.lock:
+            self.filter = bloom
+            self.confirmed = {}
+            self.loaded_at = time.monotonic()
+            self.refreshes += 1
+
+    def stale(self):
+        return self.filter is None or time.monotonic() - self.loaded_at > self.refresh_seconds
+
+    def is_banned(self, reviewer_id):
+        # Users banned after the last refresh are only caught by the next one;
+        # until then their reviews take the normal path.
+        if self.stale():
+            with self.refresh_lock:
+                if self.stale():
+                    self.refresh()
+        with self.lock:
+            self.checks += 1
+            if reviewer_id not in self.filter:
+                return False
+            if reviewer_id in self.confirmed:
+                return self.confirmed[reviewer_id]
+            self.lookups += 1
+        try:
+            item = self.dynamodb.get_item(
+                TableName=self.table_name,
+                Key={'reviewerID': {'S': reviewer_id}},
+                ProjectionExpression='banned'
+            ).get('Item', {})
+        except (BotoCoreError, ClientError) as e:
+            print(f"Could not check whether {reviewer_id} is banned, treating as not banned: {e}")
+            with self.lock:
+                self.errors += 1
+            return False
+        banned = item.get('banned', {}).get('BOOL', False)
+        with self.lock:
+            self.confirmed[reviewer_id] = banned
+        return banned
+
+    def stats(self):
+        with self.lock:
+            return {'checks': self.checks, 'lookups': self.lookups, 'refreshes': self.refreshes,
+                    'errors': self.errors}
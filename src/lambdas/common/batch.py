@@ -0,0 +1,42 @@
+import time
+
+BATCH_SIZE = 25  # BatchWriteItem limit
+GET_BATCH_SIZE = 100  # BatchGetItem limit
+
+
+def batch_write(dynamodb, table_name, requests, max_retries=8):
+    # Writes PutRequest/DeleteRequest entries 25 at a time, retrying whatever
+    # DynamoDB hands back as unprocessed with exponential backoff.
+    written = 0
+    for start in range(0, len(requests), BATCH_SIZE):
+        pending = {table_name: requests[start:start + BATCH_SIZE]}
+        attempt = 0
+        while pending:
+            response = dynamodb.batch_write_item(RequestItems=pending)
+            pending = response.get('UnprocessedItems') or {}
+            if pending:
+                attempt += 1
+                if attempt > max_retries:
+                    raise RuntimeError(f"{len(pending[table_name])} writes to {table_name} still unprocessed")
+                time.sleep(min(0.05 * 2 ** attempt, 2))
+        written += len(requests[start:start + BATCH_SIZE])
+    return written
+
+
+def batch_get(dynamodb, table_name, keys, max_retries=8, **request):
+    # Reads items by key 100 at a time, retrying unprocessed keys with the same
+    # backoff as batch_write. Items come back in no particular order.
+    items = []
+    for start in range(0, len(keys), GET_BATCH_SIZE):
+        pending = {table_name: dict(request, Keys=keys[start:start + GET_BATCH_SIZE])}
+        attempt = 0
+        while pending:
+            response = dynamodb.batch_get_item(RequestItems=pending)
+            items.extend(response['Responses'].get(table_name, []))
+            pending = response.get('UnprocessedKeys') or {}
+            if pending:
+                attempt += 1
+                if attempt > max_retries:
+                    raise RuntimeError(f"{len(pending[table_name]['Keys'])} reads from {table_name} still unprocessed")
+                time.sleep(min(0.05 * 2 ** attempt, 2))
+    return items
@@ -0,0 +1,57 @@
+import gzip
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Review dumps may be uploaded gzip or zstd compressed. They are decompressed
+# while being read, so only one chunk of the decompressed text is in memory at
+# a time. zstandard is optional; without it .zst objects fail with an error.
+CHUNK_BYTES = 1024 * 1024
+
+EXTENSIONS = {'.gz': 'gzip', '.gzip': 'gzip', '.zst': 'zstd', '.zstd': 'zstd'}
+CONTENT_TYPES = {'application/gzip': 'gzip', 'application/x-gzip': 'gzip', 'application/zstd': 'zstd'}
+
+
+def detect_compression(key, content_encoding=None, content_type=None):
+    for extension, compression in EXTENSIONS.items():
+        if key.lower().endswith(extension):
+            return compression
+    if content_encoding in ('gzip', 'zstd'):
+        return content_encoding
+    return CONTENT_TYPES.get(content_type)
+
+
+def open_stream(body, compression):
+    # body is any file-like object with read(), e.g. a botocore StreamingBody
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=body, mode='rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstandard is not installed, cannot read zstd objects")
+        return zstandard.ZstdDecompressor().stream_reader(body, read_across_frames=True)
+    return body
+
+
+def stream_lines(stream, chunk_bytes=CHUNK_BYTES):
+    # Yields (offset, line) like reading the whole text and splitting it, with
+    # offsets counted in the decompressed text
+    offset = 0
+    pending = b''
+    while True:
+        chunk = stream.read(chunk_bytes)
+        if not chunk:
+            break
+        pending += chunk
+        start = 0
+        while True:
+            end = pending.find(b'\n', start)
+            if end == -1:
+                break
+            yield offset + start, pending[start:end].rstrip(b'\r')
+            start = end + 1
+        offset += start
+        pending = pending[start:]
+    if pending:
+        yield offset, pending.rstrip(b'\r')
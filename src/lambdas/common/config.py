@@ -0,0 +1,8 @@
+# SSM lookups are cached per container, so warm invocations skip the round trip.
+_parameters = {}
+
+
+def get_parameter(ssm, name):
+    if name not in _parameters:
+        _parameters[name] = ssm.get_parameter(Name=name)['Parameter']['Value']
+    return _parameters[name]
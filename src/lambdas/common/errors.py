@@ -0,0 +1,10 @@
+def condition_failed(error):
+    # True when a ClientError was caused by a ConditionExpression, either on a
+    # single write or on one of the actions of a cancelled transaction.
+    code = error.response['Error']['Code']
+    if code == 'ConditionalCheckFailedException':
+        return True
+    if code == 'TransactionCanceledException':
+        reasons = error.response.get('CancellationReasons', [])
+        return any(reason.get('Code') == 'ConditionalCheckFailed' for reason in reasons)
+    return False
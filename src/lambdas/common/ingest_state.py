@@ -0,0 +1,63 @@
+import hashlib
+import time
+
+from common.jsoncodec import dumps, loads
+
+# Per-object record of what pre_process has already ingested: the ETag, the
+# number of bytes processed and a hash per block of lines. A re-upload with the
+# same ETag is skipped without reading it; any other change is narrowed down to
+# the blocks whose hash differs. With INGEST_VERIFY=append, a larger object
+# whose old last block is unchanged costs a range GET of the new bytes only.
+# Compressed objects cannot be read by range and only keep their ETag.
+BLOCK_BYTES = 1024 * 1024
+
+
+def block_hash(data):
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+
+def split_blocks(data, base=0, block_bytes=BLOCK_BYTES):
+    # Returns [start, end, hash] blocks covering data; blocks end on a line
+    # boundary once they hold block_bytes, so a block is always whole lines
+    blocks = []
+    start = 0
+    while start < len(data):
+        end = data.find(b'\n', start + block_bytes - 1)
+        end = len(data) if end == -1 else end + 1
+        blocks.append([base + start, base + end, block_hash(data[start:end])])
+        start = end
+    return blocks
+
+
+def load_state(dynamodb, table_name, source_key):
+    item = dynamodb.get_item(
+        TableName=table_name,
+        Key={'sourceKey': {'S': source_key}},
+        ConsistentRead=True
+    ).get('Item')
+    if item is None:
+        return None
+    return {
+        'processedBytes': int(item['processedBytes']['N']),
+        'blocks': loads(item['blocks']['S']),
+        'etag': item.get('etag', {}).get('S')
+    }
+
+
+def save_state(dynamodb, table_name, source_key, state):
+    item = {
+        'sourceKey': {'S': source_key},
+        'processedBytes': {'N': str(state['processedBytes'])},
+        'blocks': {'S': dumps(state['blocks'])},
+        'updatedAt': {'N': str(int(time.time()))}
+    }
+    if state.get('etag'):
+        item['etag'] = {'S': state['etag']}
+    dynamodb.put_item(TableName=table_name, Item=item)
+
+
+def changed_ranges(old_blocks, new_blocks):
+    # (start, end) of every new block that was not ingested before with the
+    # same bytes at the same position
+    seen = {tuple(block) for block in old_blocks}
+    return [(start, end) for start, end, digest in new_blocks if (start, end, digest) not in seen]
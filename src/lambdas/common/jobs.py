@@ -0,0 +1,140 @@
+import random
+import time
+
+from botocore.exceptions import ClientError
+
+from common.aggregates import add_update
+from common.errors import condition_failed
+
+# One job per ingested object. The 'meta' item holds what the ingesting
+# function knows (expected reviews, line counts, status); the stage counters
+# are ADDed to one of JOB_SHARDS shard items, in the same transaction as the
+# review update where the stage has one, so concurrent workers do not contend
+# on a single item. get_job sums the shards.
+JOB_SHARDS = 32
+STAGES = ('preprocessed', 'profanityChecked', 'sentimentDone')
+
+
+def job_id(source_key, etag=None):
+    # A re-uploaded object with new content is a new job
+    return source_key + '@' + etag.strip('"') if etag else source_key
+
+
+def meta_key(job):
+    return {'jobId': {'S': job}, 'part': {'S': 'meta'}}
+
+
+def job_update(table_name, job, counters):
+    # Update action adding counters to a random shard of the job
+    key = {'jobId': {'S': job}, 'part': {'S': f'shard#{random.randrange(JOB_SHARDS)}'}}
+    return add_update(table_name, key, counters)
+
+
+def start_job(dynamodb, table_name, job, **fields):
+    # Creates the meta item once; a redelivered event for the same job leaves
+    # the existing item (and its expected count) alone. Returns whether it
+    # was created.
+    item = dict(meta_key(job), status={'S': 'RUNNING'}, startedAt={'N': str(int(time.time()))})
+    for name, value in fields.items():
+        item[name] = {'N': str(value)} if isinstance(value, int) else {'S': str(value)}
+    try:
+        dynamodb.put_item(TableName=table_name, Item=item, ConditionExpression='attribute_not_exists(jobId)')
+    except ClientError as e:
+        if not condition_failed(e):
+            raise
+        return False
+    return True
+
+
+def set_expected(dynamodb, table_name, job, expected, **counts):
+    # Called once the ingesting function knows how many reviews the later
+    # stages will see; the job is complete when every stage has reached it.
+    # expected is never lowered: a second run of the same job finds the
+    # reviews already written and would otherwise report fewer. Returns
+    # whether it was set.
+    names = {'#s': 'status'}
+    values = {':e': {'N': str(expected)}, ':s': {'S': 'INGESTED'}, ':t': {'N': str(int(time.time()))}}
+    sets = ['expected = :e', '#s = :s', 'ingestedAt = :t']
+    for i, (name, count) in enumerate(sorted(counts.items())):
+        names[f'#c{i}'] = name
+        values[f':c{i}'] = {'N': str(count)}
+        sets.append(f'#c{i} = :c{i}')
+    try:
+        dynamodb.update_item(
+            TableName=table_name,
+            Key=meta_key(job),
+            UpdateExpression='SET ' + ', '.join(sets),
+            ConditionExpression='attribute_not_exists(expected) OR expected <= :e',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if not condition_failed(e):
+            raise
+        return False
+    return True
+
+
+def get_job(dynamodb, table_name, job):
+    # Meta fields plus the summed stage counters, or None for an unknown job
+    kwargs = {
+        'TableName': table_name,
+        'KeyConditionExpression': 'jobId = :j',
+        'ExpressionAttributeValues': {':j': {'S': job}},
+        'ConsistentRead': True
+    }
+    result = dict.fromkeys(STAGES, 0)
+    found = False
+    while True:
+        page = dynamodb.query(**kwargs)
+        for item in page['Items']:
+            found = True
+            for name, value in item.items():
+                if name in ('jobId', 'part'):
+                    continue
+                if 'N' in value:
+                    number = int(value['N'])
+                    result[name] = result.get(name, 0) + number if name in STAGES else number
+                elif 'S' in value:
+                    result[name] = value['S']
+        if 'LastEvaluatedKey' not in page:
+            break
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+    if not found:
+        return None
+    result['jobId'] = job
+    result['complete'] = is_complete(result)
+    return result
+
+
+def is_complete(job):
+    return 'expected' in job and all(job.get(stage, 0) >= job['expected'] for stage in STAGES)
+
+
+def wait_until(check, timeout=300, interval=0.25, max_interval=5):
+    # Polls check() until it returns something truthy, backing off from
+    # interval up to max_interval; raises TimeoutError after timeout seconds
+    deadline = time.monotonic() + timeout
+    while True:
+        result = check()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Still waiting after {timeout}s")
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+
+
+def wait_for_job(dynamodb, table_name, job, timeout=300, interval=0.25, max_interval=5):
+    # Returns the job as soon as every stage has processed all expected reviews
+    last = {}
+
+    def check():
+        last['job'] = get_job(dynamodb, table_name, job)
+        return last['job'] if last['job'] and last['job']['complete'] else None
+
+    try:
+        return wait_until(check, timeout, interval, max_interval)
+    except TimeoutError:
+        raise TimeoutError(f"Job {job} not complete after {timeout}s: {last.get('job')}") from None
@@ -0,0 +1,53 @@
+import json
+import math
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# One JSON entry point for the handlers: orjson when it is installed, the
+# standard library otherwise, with the same results either way. Output is
+# compact UTF-8 and NaN/Infinity (e.g. a missing `overall` read by pandas)
+# are written as null by both backends. Input with NaN literals, which orjson
+# rejects, is parsed by the standard library.
+
+
+def loads(data):
+    # data may be str or bytes; bytes are parsed without decoding first
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def _finite(value):
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def _dumps_stdlib(obj, default=None):
+    try:
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False, allow_nan=False, default=default)
+    except ValueError:
+        return json.dumps(_finite(obj), separators=(',', ':'), ensure_ascii=False, default=default)
+
+
+def dumpb(obj, default=None):
+    # Serialized as UTF-8 bytes, e.g. for an S3 object body
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    return _dumps_stdlib(obj, default).encode('utf-8')
+
+
+def dumps(obj, default=None):
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return _dumps_stdlib(obj, default)
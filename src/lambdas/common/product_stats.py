@@ -0,0 +1,56 @@
+import random
+
+from common.aggregates import add_update
+
+# Per-product (asin) counters, kept up to date by the handlers inside the same
+# transactions that record a review, its profanity check and its sentiment, so
+# a product's summary is one BatchGetItem instead of a scan over its reviews.
+# Dumps are sorted by asin, so the reviews of one product arrive together;
+# their counters go to one of PRODUCT_SHARDS items to keep concurrent
+# transactions from conflicting on it. Shard 0 is the plain asin, which is
+# where every counter went before the shards.
+LABELS = ('positive', 'neutral', 'negative')
+PRODUCT_SHARDS = 8
+
+
+def product_key(asin, shard):
+    return {'asin': {'S': f'{asin}#{shard}' if shard else asin}}
+
+
+def product_update(table_name, asin, counters):
+    return add_update(table_name, product_key(asin, random.randrange(PRODUCT_SHARDS)), counters)
+
+
+def review_asin(review):
+    # Reviews stored before asin was added to the item have no product
+    asin = review.get('asin')
+    return asin['S'] if asin else None
+
+
+def get_product_stats(dynamodb, table_name, asin):
+    counts = {}
+    found = False
+    request = {table_name: {'Keys': [product_key(asin, shard) for shard in range(PRODUCT_SHARDS)]}}
+    while request:
+        response = dynamodb.batch_get_item(RequestItems=request)
+        for item in response['Responses'].get(table_name, []):
+            found = True
+            for name, value in item.items():
+                if 'N' in value:
+                    counts[name] = counts.get(name, 0) + float(value['N'])
+        request = response.get('UnprocessedKeys')
+    if not found:
+        return None
+    reviews = int(counts.get('reviews', 0))
+    rated = int(counts.get('rated', 0))
+    checked = int(counts.get('checked', 0))
+    labelled = sum(int(counts.get(label, 0)) for label in LABELS)
+    return {
+        'asin': asin,
+        'reviews': reviews,
+        'meanOverall': counts.get('overallSum', 0) / rated if rated else None,
+        'sentiment': {label: int(counts.get(label, 0)) for label in LABELS},
+        'sentimentShare': {label: counts.get(label, 0) / labelled for label in LABELS} if labelled else None,
+        'profane': int(counts.get('profane', 0)),
+        'profaneShare': counts.get('profane', 0) / checked if checked else None
+    }
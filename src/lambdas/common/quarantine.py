@@ -0,0 +1,72 @@
+import time
+
+from common.batch import batch_write
+from common.scan import parallel_scan
+from common.text_codec import decode_text, encode_text
+
+# Lines pre_process could not turn into a stored review are kept here, keyed by
+# source object and byte offset, so they can be replayed on their own instead
+# of re-uploading the whole file. Lines too large for an item are stored by
+# offset/length only and re-read from S3 with a range request on replay.
+MAX_LINE_BYTES = 300000
+
+
+def quarantine_item(source_key, entry):
+    item = {
+        'sourceKey': {'S': source_key},
+        'offset': {'N': str(entry['offset'])},
+        'length': {'N': str(entry['length'])},
+        'stage': {'S': entry['stage']},
+        'error': {'S': str(entry['error'])[:1000]},
+        'attempts': {'N': str(entry.get('attempts', 1))},
+        'quarantinedAt': {'N': str(int(time.time()))}
+    }
+    if entry['length'] <= MAX_LINE_BYTES:
+        item['line'] = encode_text(entry['line'])
+    return item
+
+
+def quarantine(dynamodb, table_name, source_key, entries):
+    # entries are dicts with offset, length, line, stage, error and optionally
+    # attempts; an entry for the same line replaces the previous one
+    return batch_write(dynamodb, table_name, [
+        {'PutRequest': {'Item': quarantine_item(source_key, entry)}} for entry in entries
+    ])
+
+
+def parse_item(item):
+    return {
+        'sourceKey': item['sourceKey']['S'],
+        'offset': int(item['offset']['N']),
+        'length': int(item['length']['N']),
+        'line': decode_text(item['line']) if 'line' in item else None,
+        'stage': item['stage']['S'],
+        'error': item['error']['S'],
+        'attempts': int(item['attempts']['N'])
+    }
+
+
+def load_quarantined(dynamodb, table_name, source_key=None):
+    items = []
+    if source_key is None:
+        parallel_scan(dynamodb, table_name, lambda segment, page: items.extend(page['Items']), segments=4)
+    else:
+        kwargs = {
+            'TableName': table_name,
+            'KeyConditionExpression': 'sourceKey = :key',
+            'ExpressionAttributeValues': {':key': {'S': source_key}}
+        }
+        while True:
+            page = dynamodb.query(**kwargs)
+            items.extend(page['Items'])
+            if 'LastEvaluatedKey' not in page:
+                break
+            kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+    return sorted((parse_item(item) for item in items), key=lambda entry: (entry['sourceKey'], entry['offset']))
+
+
+def release(dynamodb, table_name, source_key, offsets):
+    return batch_write(dynamodb, table_name, [
+        {'DeleteRequest': {'Key': {'sourceKey': {'S': source_key}, 'offset': {'N': str(offset)}}}}
+        for offset in offsets
+    ])
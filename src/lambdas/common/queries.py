@@ -0,0 +1,98 @@
+import zlib
+
+# Lookups through the secondary indexes created in setup.sh, so a question
+# like "all negative reviews" or "banned users" reads only the matching items
+# instead of scanning the table. All three indexes are sparse: their key
+# attributes are only set on labelled reviews, profane reviews and banned users.
+# sentimentLabel is written together with the final label (never PENDING or
+# SKIPPED), as LABEL#shard so one label is spread over SENTIMENT_SHARDS
+# partitions; reviews_by_sentiment reads all of them.
+SENTIMENT_INDEX = 'SentimentIndex'
+SENTIMENT_KEY = 'sentimentLabel'
+SENTIMENT_SHARDS = 4
+PROFANE_INDEX = 'ProfaneIndex'
+BANNED_INDEX = 'BannedIndex'
+BANNED_FLAG = 'BANNED'
+
+
+def sentiment_label(label, review_id):
+    # The shard follows from the review, so relabelling keeps it
+    return f"{label}#{zlib.crc32(review_id.encode('utf-8')) % SENTIMENT_SHARDS}"
+
+
+def query_page(dynamodb, table_name, index_name, key_name, value, limit=100, start_key=None, **query_kwargs):
+    # One page of an index query; returns (items, next start key or None) so
+    # callers can hand the key back for the following page
+    kwargs = dict(
+        query_kwargs,
+        TableName=table_name,
+        IndexName=index_name,
+        KeyConditionExpression='#k = :v',
+        ExpressionAttributeNames={'#k': key_name},
+        ExpressionAttributeValues={':v': {'S': value}},
+        Limit=limit
+    )
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    page = dynamodb.query(**kwargs)
+    return page['Items'], page.get('LastEvaluatedKey')
+
+
+def query_all(dynamodb, table_name, index_name, key_name, value, limit=1000, **query_kwargs):
+    # Yields every matching item, following LastEvaluatedKey
+    start_key = None
+    while True:
+        items, start_key = query_page(dynamodb, table_name, index_name, key_name, value,
+                                      limit, start_key, **query_kwargs)
+        yield from items
+        if not start_key:
+            return
+
+
+def query_count(dynamodb, table_name, index_name, key_name, value):
+    kwargs = dict(
+        TableName=table_name,
+        IndexName=index_name,
+        KeyConditionExpression='#k = :v',
+        ExpressionAttributeNames={'#k': key_name},
+        ExpressionAttributeValues={':v': {'S': value}},
+        Select='COUNT'
+    )
+    count = 0
+    while True:
+        page = dynamodb.query(**kwargs)
+        count += page['Count']
+        if 'LastEvaluatedKey' not in page:
+            return count
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def scan_index(dynamodb, table_name, index_name, **scan_kwargs):
+    # Reading a whole sparse index costs the number of items in it
+    kwargs = dict(scan_kwargs, TableName=table_name, IndexName=index_name)
+    while True:
+        page = dynamodb.scan(**kwargs)
+        yield from page['Items']
+        if 'LastEvaluatedKey' not in page:
+            return
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def reviews_by_sentiment(dynamodb, table_name, label, **query_kwargs):
+    for shard in range(SENTIMENT_SHARDS):
+        yield from query_all(dynamodb, table_name, SENTIMENT_INDEX, SENTIMENT_KEY, f'{label}#{shard}', **query_kwargs)
+
+
+def sentiment_count(dynamodb, table_name, label):
+    return sum(query_count(dynamodb, table_name, SENTIMENT_INDEX, SENTIMENT_KEY, f'{label}#{shard}')
+               for shard in range(SENTIMENT_SHARDS))
+
+
+def profane_reviews(dynamodb, table_name, reviewer_id=None, **kwargs):
+    if reviewer_id is None:
+        return scan_index(dynamodb, table_name, PROFANE_INDEX, **kwargs)
+    return query_all(dynamodb, table_name, PROFANE_INDEX, 'profaneReviewer', reviewer_id, **kwargs)
+
+
+def banned_users(dynamodb, table_name, **query_kwargs):
+    return query_all(dynamodb, table_name, BANNED_INDEX, 'bannedFlag', BANNED_FLAG, **query_kwargs)
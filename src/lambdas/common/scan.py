@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from common.batch import batch_write
+
+
+def scan_segment(dynamodb, table_name, segment, total_segments, handle_page, start_key=None, **scan_kwargs):
+    # Follows LastEvaluatedKey until the segment is exhausted; a single scan
+    # call only returns the first 1 MB.
+    kwargs = dict(scan_kwargs, TableName=table_name, Segment=segment, TotalSegments=total_segments)
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    scanned = 0
+    while True:
+        page = dynamodb.scan(**kwargs)
+        scanned += page['Count']
+        handle_page(segment, page)
+        if 'LastEvaluatedKey' not in page:
+            return scanned
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def parallel_scan(dynamodb, table_name, handle_page, segments=8, workers=None, start_keys=None, **scan_kwargs):
+    # handle_page(segment, page) is called from the worker threads with every
+    # raw scan response. start_keys maps segment -> ExclusiveStartKey to resume.
+    # Returns the number of items scanned.
+    start_keys = start_keys or {}
+    with ThreadPoolExecutor(max_workers=workers or segments) as pool:
+        futures = [
+            pool.submit(scan_segment, dynamodb, table_name, segment, segments, handle_page,
+                        start_keys.get(segment), **scan_kwargs)
+            for segment in range(segments)
+        ]
+        return sum(future.result() for future in futures)
+
+
+def key_names(dynamodb, table_name):
+    schema = dynamodb.describe_table(TableName=table_name)['Table']['KeySchema']
+    return [key['AttributeName'] for key in schema]
+
+
+def parallel_count(dynamodb, table_name, segments=8, workers=None, **scan_kwargs):
+    return parallel_scan(dynamodb, table_name, lambda segment, page: None,
+                         segments=segments, workers=workers, Select='COUNT', **scan_kwargs)
+
+
+def bulk_delete(dynamodb, table_name, segments=8, workers=None):
+    keys = key_names(dynamodb, table_name)
+    names = {f'#k{i}': key for i, key in enumerate(keys)}
+
+    def delete_page(segment, page):
+        batch_write(dynamodb, table_name, [{'DeleteRequest': {'Key': item}} for item in page['Items']])
+
+    return parallel_scan(dynamodb, table_name, delete_page, segments=segments, workers=workers,
+                         ProjectionExpression=', '.join(names), ExpressionAttributeNames=names)
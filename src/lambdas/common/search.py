@@ -0,0 +1,130 @@
+import heapq
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+
+from common.text_codec import decode_text
+
+# Inverted index from lemma to review IDs. The hash key is term#shard, so common
+# terms are spread over TERM_SHARDS partitions; the range key (segment) is a
+# bucket, the first BUCKET_CHARS characters of the reviewIds it holds. pre_process
+# ADDs the new reviewIds of a flush to the string set of their bucket item, so a
+# term has one item per shard and bucket however often it is flushed, and a
+# replayed flush changes nothing. Buckets sort like the reviewIds in them, so a
+# query reads them in order and stops once it has a page. reviewIds start with
+# the reviewerID (A + 13 characters), so the reviews of a term are spread over
+# about 36 * 36 buckets per shard; an item stays below the 400 KB limit up to
+# some 50 million reviews containing one lemma.
+# The reviewIds are stored as plain strings, not compressed: ADD on a string
+# set is what keeps one item per bucket and makes a replayed flush a no-op, and
+# a flush adds only a few ids to each bucket, too few for deflate to save
+# anything. The price is roughly 2-3x the bytes of deflated id lists in storage
+# and read units. Terms are expected to be lemmas already, as pre_process
+# writes them (code/search_reviews.py runs queries through its NLP).
+TERM_SHARDS = 4
+BUCKET_CHARS = 3
+# Bounds the memory of a builder
+MAX_POSTINGS = 50000
+# Bucket updates in flight during a flush
+FLUSH_CONCURRENCY = 16
+# Buckets read per query call while searching
+BUCKETS_PER_QUERY = 25
+
+
+def shard_of(review_id):
+    return zlib.crc32(review_id.encode('utf-8')) % TERM_SHARDS
+
+
+def bucket_of(review_id):
+    return review_id[:BUCKET_CHARS]
+
+
+def review_key(review_id):
+    # reviewId is reviewerID-asin-unixReviewTime, and only reviewerID may be
+    # needed to read the review back
+    return {'reviewerID': {'S': review_id.rsplit('-', 2)[0]}, 'reviewId': {'S': review_id}}
+
+
+class IndexBuilder:
+    def __init__(self, dynamodb, table_name, max_postings=MAX_POSTINGS):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.max_postings = max_postings
+        self.postings = {}
+        self.size = 0
+        self.updates = 0
+
+    def add(self, review):
+        review_id = review['reviewId']['S']
+        key = (shard_of(review_id), bucket_of(review_id))
+        text = decode_text(review['processedreviewText']) + ' ' + decode_text(review['processedSummary'])
+        for term in set(text.split()):
+            self.postings.setdefault((term,) + key, set()).add(review_id)
+        self.size += 1
+        if self.size >= self.max_postings:
+            self.flush()
+
+    def append(self, entry):
+        (term, shard, bucket), ids = entry
+        self.dynamodb.update_item(
+            TableName=self.table_name,
+            Key={'term': {'S': f'{term}#{shard}'}, 'segment': {'S': bucket}},
+            UpdateExpression='ADD ids :ids',
+            ExpressionAttributeValues={':ids': {'SS': sorted(ids)}}
+        )
+
+    def flush(self):
+        postings, self.postings, self.size = self.postings, {}, 0
+        if postings:
+            with ThreadPoolExecutor(max_workers=FLUSH_CONCURRENCY) as pool:
+                list(pool.map(self.append, postings.items()))
+        self.updates += len(postings)
+        return len(postings)
+
+
+def term_buckets(dynamodb, table_name, term, shard, start=None):
+    # (bucket, reviewIds) of one term and shard in bucket order, from the
+    # bucket start on
+    kwargs = {
+        'TableName': table_name,
+        'KeyConditionExpression': '#t = :t',
+        'ExpressionAttributeNames': {'#t': 'term'},
+        'ExpressionAttributeValues': {':t': {'S': f'{term}#{shard}'}},
+        'Limit': BUCKETS_PER_QUERY
+    }
+    if start:
+        kwargs['KeyConditionExpression'] += ' AND #s >= :s'
+        kwargs['ExpressionAttributeNames']['#s'] = 'segment'
+        kwargs['ExpressionAttributeValues'][':s'] = {'S': start}
+    while True:
+        page = dynamodb.query(**kwargs)
+        for item in page['Items']:
+            yield item['segment']['S'], item['ids']['SS']
+        if 'LastEvaluatedKey' not in page:
+            return
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def search(dynamodb, table_name, terms, match='all', limit=100, cursor=None):
+    # Review IDs containing all (AND) or any (OR) of the lemmatized terms, in
+    # reviewId order. Returns (ids, cursor for the next page or None). The
+    # buckets of every term and shard are merged in bucket order, and reading
+    # stops after the bucket that completes the page.
+    terms = list(dict.fromkeys(term.lower() for term in terms))
+    start = bucket_of(cursor) if cursor else None
+    def stream(i, term, shard):
+        for bucket, ids in term_buckets(dynamodb, table_name, term, shard, start):
+            yield bucket, i, ids
+
+    streams = [stream(i, term, shard) for i, term in enumerate(terms) for shard in range(TERM_SHARDS)]
+    matches = []
+    for bucket, entries in groupby(heapq.merge(*streams, key=lambda entry: entry[0]), key=lambda entry: entry[0]):
+        found = [set() for _ in terms]
+        for _, i, ids in entries:
+            found[i].update(ids)
+        ids = set.intersection(*found) if match == 'all' else set.union(*found)
+        matches.extend(sorted(review_id for review_id in ids if cursor is None or review_id > cursor))
+        if len(matches) > limit:
+            page = matches[:limit]
+            return page, page[-1]
+    return matches, None
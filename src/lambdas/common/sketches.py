@@ -0,0 +1,257 @@
+import hashlib
+import math
+import struct
+import threading
+import time
+import uuid
+import zlib
+from array import array
+
+from botocore.exceptions import ClientError
+
+from common.batch import batch_write
+from common.errors import condition_failed
+from common.jsoncodec import dumpb, loads
+from common.throttle import transact_write
+
+# Fixed-size, mergeable summaries for the ops dashboards: a Count-Min sketch
+# with a heavy-hitter list for term frequencies and a HyperLogLog for distinct
+# reviewers. Each invocation writes its partial sketches as new items under
+# window#name (one window per UTC day); readers merge all parts of a window.
+# A counter item (part COUNTER_PART) counts the parts written to a window, and
+# the writer of every COMPACT_EVERY-th part merges them into one, so a window
+# keeps a bounded number of parts without a scheduled job.
+COUNTER_PART = '#parts'
+COMPACT_EVERY = 16
+# Parts replaced by one merged part per transaction (100 actions at most)
+COMPACT_BATCH = 99
+
+
+def hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class CountMinSketch:
+    # Estimates never undercount; they overcount by at most 2/width of the
+    # total with probability 1 - (1/2)^depth
+    def __init__(self, width=2048, depth=4, top=50, counts=None, candidates=None):
+        self.width = width
+        self.depth = depth
+        self.top = top
+        self.counts = counts if counts is not None else array('I', bytes(4 * width * depth))
+        self.candidates = candidates or {}
+
+    def _cells(self, term):
+        h = hash64(term)
+        h1, h2 = h & 0xffffffff, (h >> 32) | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, term, count=1):
+        cells = self._cells(term)
+        for cell in cells:
+            self.counts[cell] += count
+        self._track(term, min(self.counts[cell] for cell in cells))
+
+    def estimate(self, term):
+        return min(self.counts[cell] for cell in self._cells(term))
+
+    def _track(self, term, estimate):
+        # Keeps roughly the `top` heaviest terms seen; the list is pruned once
+        # it grows to twice that size
+        self.candidates[term] = estimate
+        if len(self.candidates) > 2 * self.top:
+            keep = sorted(self.candidates.items(), key=lambda item: -item[1])[:self.top]
+            self.candidates = dict(keep)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        for term in list(self.candidates) + list(other.candidates):
+            self._track(term, self.estimate(term))
+
+    def heavy_hitters(self, k=None):
+        return sorted(self.candidates.items(), key=lambda item: -item[1])[:k or self.top]
+
+    def to_bytes(self):
+        header = struct.pack('<cHHH', b'C', self.width, self.depth, self.top)
+        terms = dumpb(self.candidates)
+        return zlib.compress(header + struct.pack('<I', len(terms)) + terms + self.counts.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data, header):
+        width, depth, top = struct.unpack('<HHH', header)
+        (length,) = struct.unpack('<I', data[:4])
+        candidates = loads(data[4:4 + length])
+        counts = array('I')
+        counts.frombytes(data[4 + length:])
+        return cls(width, depth, top, counts, candidates)
+
+
+class HyperLogLog:
+    # 2^precision one-byte registers; standard error about 1.04 / sqrt(2^precision)
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, value):
+        h = hash64(value)
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        for i, rank in enumerate(other.registers):
+            if rank > self.registers[i]:
+                self.registers[i] = rank
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(estimate)
+
+    def to_bytes(self):
+        return zlib.compress(struct.pack('<cB', b'H', self.precision) + bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data, header):
+        (precision,) = struct.unpack('<B', header)
+        return cls(precision, bytearray(data))
+
+
+def decode_sketch(blob):
+    data = zlib.decompress(blob)
+    if data[:1] == b'C':
+        return CountMinSketch.from_bytes(data[7:], data[1:7])
+    return HyperLogLog.from_bytes(data[2:], data[1:2])
+
+
+def current_window():
+    return time.strftime('%Y-%m-%d', time.gmtime())
+
+
+class SketchWriter:
+    # Sketches of one invocation, updated from the worker threads and written
+    # as new parts by flush()
+    def __init__(self, dynamodb, table_name, source):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.source = source
+        self.sketches = {}
+        self.lock = threading.Lock()
+
+    def _sketch(self, name, factory):
+        if name not in self.sketches:
+            self.sketches[name] = factory()
+        return self.sketches[name]
+
+    def add_terms(self, name, terms):
+        with self.lock:
+            sketch = self._sketch(name, CountMinSketch)
+            for term in terms:
+                sketch.add(term)
+
+    def add_distinct(self, name, value):
+        with self.lock:
+            self._sketch(name, HyperLogLog).add(value)
+
+    def flush(self):
+        with self.lock:
+            sketches, self.sketches = self.sketches, {}
+        if not sketches:
+            return 0
+        window = current_window()
+        part = f'{self.source}#{uuid.uuid4().hex[:12]}'
+        written = batch_write(self.dynamodb, self.table_name, [
+            {'PutRequest': {'Item': {
+                'sketch': {'S': f'{window}#{name}'},
+                'part': {'S': part},
+                'data': {'B': sketch.to_bytes()}
+            }}}
+            for name, sketch in sketches.items()
+        ])
+        for name in sketches:
+            if count_part(self.dynamodb, self.table_name, window, name) % COMPACT_EVERY == 0:
+                try:
+                    compact(self.dynamodb, self.table_name, window, name)
+                except Exception as e:
+                    print(f"Could not compact {window}#{name}: {e}")
+        return written
+
+
+def count_part(dynamodb, table_name, window, name):
+    # Returns how many parts have been written to the window so far
+    response = dynamodb.update_item(
+        TableName=table_name,
+        Key={'sketch': {'S': f'{window}#{name}'}, 'part': {'S': COUNTER_PART}},
+        UpdateExpression='ADD parts :one',
+        ExpressionAttributeValues={':one': {'N': '1'}},
+        ReturnValues='UPDATED_NEW'
+    )
+    return int(response['Attributes']['parts']['N'])
+
+
+def load_parts(dynamodb, table_name, window, name):
+    kwargs = {
+        'TableName': table_name,
+        'KeyConditionExpression': 'sketch = :s',
+        'ExpressionAttributeValues': {':s': {'S': f'{window}#{name}'}}
+    }
+    parts = []
+    while True:
+        page = dynamodb.query(**kwargs)
+        parts.extend(item for item in page['Items'] if 'data' in item)
+        if 'LastEvaluatedKey' not in page:
+            return parts
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
+
+
+def merged_sketch(dynamodb, table_name, window, name):
+    merged = None
+    for item in load_parts(dynamodb, table_name, window, name):
+        sketch = decode_sketch(item['data']['B'])
+        if merged is None:
+            merged = sketch
+        else:
+            merged.merge(sketch)
+    return merged
+
+
+def compact(dynamodb, table_name, window, name):
+    # Replaces the parts of a window's sketch by their merge, so later reads
+    # fetch one item instead of one per invocation. The merged part is written
+    # in one transaction with the deletes of the parts it holds, each on the
+    # condition that the part still exists: a part merged by a concurrent
+    # compaction is never counted twice. Returns the number of parts merged.
+    parts = load_parts(dynamodb, table_name, window, name)
+    compacted = 0
+    for start in range(0, len(parts), COMPACT_BATCH):
+        batch = parts[start:start + COMPACT_BATCH]
+        if len(batch) < 2:
+            break
+        merged = decode_sketch(batch[0]['data']['B'])
+        for item in batch[1:]:
+            merged.merge(decode_sketch(item['data']['B']))
+        transact_items = [{'Put': {'TableName': table_name, 'Item': {
+            'sketch': {'S': f'{window}#{name}'},
+            'part': {'S': f'compacted#{uuid.uuid4().hex[:12]}'},
+            'data': {'B': merged.to_bytes()}
+        }}}]
+        transact_items.extend({'Delete': {
+            'TableName': table_name,
+            'Key': {'sketch': item['sketch'], 'part': item['part']},
+            'ConditionExpression': 'attribute_exists(part)'
+        }} for item in batch)
+        try:
+            transact_write(dynamodb, transact_items)
+        except ClientError as e:
+            if not condition_failed(e):
+                raise
+            continue
+        compacted += len(batch)
+    return compacted
@@ -0,0 +1,147 @@
+import gc
+import gzip
+import json
+import marshal
+import os
+import threading
+
+
+def load_frequencies(path=None, min_count=1):
+    # Defaults to the English word list that ships with pyspellchecker, read
+    # directly so the slow SpellChecker object is never built.
+    if path is None:
+        import spellchecker
+        path = os.path.join(os.path.dirname(spellchecker.__file__), 'resources', 'en.json.gz')
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        frequencies = json.load(f)
+    return {word: count for word, count in frequencies.items() if count >= min_count}
+
+
+def deletes(word, max_distance):
+    # Every string reachable from word by removing up to max_distance characters
+    found = {word}
+    frontier = [word]
+    for _ in range(max_distance):
+        next_frontier = []
+        for candidate in frontier:
+            for i in range(len(candidate)):
+                shorter = candidate[:i] + candidate[i + 1:]
+                if shorter not in found:
+                    found.add(shorter)
+                    next_frontier.append(shorter)
+        frontier = next_frontier
+    return found
+
+
+def edit_distance(a, b, max_distance):
+    # Optimal string alignment distance (adjacent transpositions count as one
+    # edit), giving up early once every cell in a row exceeds max_distance.
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1
+                    and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class SymSpell:
+    # Symmetric-delete spelling corrector. Dictionary words are indexed by the
+    # deletes of their first prefix_length characters once; a lookup only
+    # generates deletes of the input and verifies the few words they hit,
+    # instead of enumerating every insert/replace/transpose like pyspellchecker.
+    # Same selection rule as pyspellchecker: smallest distance, then highest
+    # frequency. Results are memoised per token.
+
+    def __init__(self, frequencies, index, max_distance=2, prefix_length=7, memo_size=200000):
+        self.frequencies = frequencies
+        self.index = index  # delete -> space separated dictionary words
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.memo_size = memo_size
+        self.memo = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, frequencies, max_distance=2, prefix_length=7, **kwargs):
+        # About a million buckets for the English list; collection is paused
+        # while they are created, it only slows the build down.
+        gc.disable()
+        try:
+            buckets = {}
+            for word in frequencies:
+                for delete in deletes(word[:prefix_length], max_distance):
+                    bucket = buckets.get(delete)
+                    if bucket is None:
+                        buckets[delete] = [word]
+                    else:
+                        bucket.append(word)
+            index = {delete: ' '.join(words) for delete, words in buckets.items()}
+        finally:
+            gc.enable()
+        return cls(frequencies, index, max_distance, prefix_length, **kwargs)
+
+    def save(self, path):
+        # marshal is by far the fastest loader for plain dicts of strings; the
+        # file has to be written by the same Python version that reads it.
+        with open(path, 'wb') as f:
+            marshal.dump((self.max_distance, self.prefix_length, self.frequencies, self.index), f)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        gc.disable()
+        try:
+            with open(path, 'rb') as f:
+                max_distance, prefix_length, frequencies, index = marshal.load(f)
+        finally:
+            gc.enable()
+        return cls(frequencies, index, max_distance, prefix_length, **kwargs)
+
+    def correction(self, word):
+        if word in self.frequencies:
+            return word
+        corrected = self.memo.get(word)
+        if corrected is None:
+            corrected = self._lookup(word)
+            with self.lock:
+                if len(self.memo) >= self.memo_size:
+                    self.memo.clear()
+                self.memo[word] = corrected
+        return corrected
+
+    def _lookup(self, word):
+        best = word
+        best_distance = self.max_distance + 1
+        best_count = 0
+        checked = set()
+        for delete in deletes(word[:self.prefix_length], self.max_distance):
+            bucket = self.index.get(delete)
+            if bucket is None:
+                continue
+            for candidate in bucket.split(' '):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                distance = edit_distance(word, candidate, min(best_distance, self.max_distance))
+                if distance > self.max_distance:
+                    continue
+                count = self.frequencies[candidate]
+                if distance < best_distance or (distance == best_distance and count > best_count):
+                    best, best_distance, best_count = candidate, distance, count
+        return best
+
+    def correct_tokens(self, tokens):
+        return [self.correction(token) for token in tokens]
@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+SHARED_TTL_SECONDS = 30 * 24 * 3600
+
+
+class TextCache:
+    # Content-addressed cache of processed text. Keys hash the pipeline version
+    # together with the input, so bumping the version orphans every old entry.
+    # Lookups go to the in-container LRU first, then to the optional shared
+    # DynamoDB table (key attribute: textHash).
+
+    def __init__(self, version, max_entries=50000, dynamodb=None, table_name=None):
+        self.version = str(version)
+        self.max_entries = max_entries
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.version}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_or_compute(self, text, compute):
+        key = self.key(text)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+
+        value = self._get_shared(key)
+        if value is not None:
+            with self.lock:
+                self.shared_hits += 1
+        else:
+            value = compute(text)
+            with self.lock:
+                self.misses += 1
+            self._put_shared(key, value)
+
+        with self.lock:
+            self.entries[key] = value
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def _get_shared(self, key):
+        if not self.table_name:
+            return None
+        response = self.dynamodb.get_item(TableName=self.table_name, Key={'textHash': {'S': key}})
+        if 'Item' in response:
+            return response['Item']['processed']['S']
+        return None
+
+    def _put_shared(self, key, value):
+        if not self.table_name:
+            return
+        self.dynamodb.put_item(TableName=self.table_name, Item={
+            'textHash': {'S': key},
+            'processed': {'S': value},
+            'version': {'S': self.version},
+            'expiresAt': {'N': str(int(time.time()) + SHARED_TTL_SECONDS)}
+        })
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'version': self.version,
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'sharedHits': self.shared_hits,
+                'misses': self.misses,
+                'hitRate': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0
+            }
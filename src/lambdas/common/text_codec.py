@@ -0,0 +1,65 @@
+import base64
+import zlib
+
+# Processed text can be stored as a binary (B) attribute holding a format byte
+# followed by raw DEFLATE data. decode_text accepts either representation, so
+# readers do not care which one the writer picked.
+FORMAT_DEFLATE = b'\x01'
+
+
+def encode_text(text, compact=True):
+    if not compact:
+        return {'S': text}
+    raw = text.encode('utf-8')
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    packed = FORMAT_DEFLATE + compressor.compress(raw) + compressor.flush()
+    # Short strings do not compress; keep them readable
+    if len(packed) >= len(raw):
+        return {'S': text}
+    return {'B': packed}
+
+
+def decode_text(attribute):
+    if 'S' in attribute:
+        return attribute['S']
+    packed = attribute['B']
+    # Stream records deliver binary attributes base64 encoded
+    if isinstance(packed, str):
+        packed = base64.b64decode(packed)
+    if packed[:1] != FORMAT_DEFLATE:
+        raise ValueError(f"Unknown text encoding {packed[:1]!r}")
+    return zlib.decompress(packed[1:], -15).decode('utf-8')
+
+
+def readable_item(item):
+    # A copy of an item that json.dumps accepts: compact text is stored as its
+    # string, any other binary attribute as base64 like the AWS CLI prints it
+    readable = {}
+    for name, attribute in item.items():
+        if 'B' in attribute:
+            try:
+                attribute = {'S': decode_text(attribute)}
+            except (ValueError, zlib.error, UnicodeDecodeError):
+                attribute = {'B': base64.b64encode(attribute['B']).decode('ascii')}
+        readable[name] = attribute
+    return readable
+
+
+def attribute_size(name, attribute):
+    # DynamoDB's item size rules: name bytes plus value bytes, numbers take
+    # roughly one byte per two significant digits plus one.
+    size = len(name.encode('utf-8'))
+    if 'S' in attribute:
+        return size + len(attribute['S'].encode('utf-8'))
+    if 'B' in attribute:
+        return size + len(attribute['B'])
+    if 'N' in attribute:
+        digits = attribute['N'].lstrip('-').replace('.', '').strip('0')
+        return size + (len(digits) + 1) // 2 + 1
+    if 'BOOL' in attribute or 'NULL' in attribute:
+        return size + 1
+    raise ValueError(f"Unsupported attribute {attribute}")
+
+
+def item_size(item):
+    return sum(attribute_size(name, attribute) for name, attribute in item.items())
@@ -0,0 +1,154 @@
+import os
+import random
+import threading
+import time
+
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from common.jsoncodec import dumps
+
+THROTTLE_CODES = {
+    'ProvisionedThroughputExceededException',
+    'ThrottlingException',
+    'RequestLimitExceeded',
+}
+THROTTLE_REASONS = {'ThrottlingError', 'ProvisionedThroughputExceeded'}
+# Cancellation reasons after which the same transaction can simply be sent again
+RETRY_REASONS = THROTTLE_REASONS | {'TransactionConflict'}
+
+# Throttled calls are retried by botocore (with backoff) instead of surfacing
+# after the default handful of attempts; the limiter below paces every attempt.
+RETRY_CONFIG = Config(retries={'mode': 'standard', 'max_attempts': 10})
+
+
+class AdaptiveRateLimiter:
+    # AIMD token bucket. Each success adds increase/rate requests per second,
+    # i.e. about `increase` per second of throttle-free traffic; a throttle
+    # multiplies the rate by `decrease`, at most once per cooldown so that one
+    # burst of concurrent rejections does not collapse it.
+
+    def __init__(self, rate=500.0, min_rate=10.0, max_rate=5000.0, increase=25.0, decrease=0.5, cooldown=0.2):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.throttles = 0
+        self.reported_throttles = 0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                # Allow up to a tenth of a second worth of burst
+                self.tokens = min(max(1.0, self.rate / 10), self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self):
+        with self.lock:
+            self.throttles += 1
+            now = time.monotonic()
+            if now - self.last_decrease >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self.last_decrease = now
+
+    def attach(self, client):
+        # Hooks into botocore's per-attempt events, so retries made inside
+        # botocore are paced and observed too.
+        service = client.meta.service_model.service_id.hyphenize()
+        client.meta.events.register(f'before-send.{service}', self._before_send)
+        client.meta.events.register(f'needs-retry.{service}', self._after_attempt)
+        return client
+
+    def _before_send(self, **kwargs):
+        self.acquire()
+
+    def _after_attempt(self, response=None, caught_exception=None, **kwargs):
+        if response is None:
+            return None
+        http_response, parsed = response
+        error = parsed.get('Error', {})
+        reasons = {reason.get('Code') for reason in parsed.get('CancellationReasons', [])}
+        if error.get('Code') in THROTTLE_CODES or reasons & THROTTLE_REASONS:
+            self.on_throttle()
+        elif http_response.status_code < 400:
+            self.on_success()
+        # Never vote on the retry decision itself
+        return None
+
+    def metrics(self):
+        with self.lock:
+            return {'rate': round(self.rate, 1), 'requests': self.requests, 'throttles': self.throttles}
+
+    def emit_metrics(self, function_name):
+        # CloudWatch embedded metric format, picked up from the Lambda log.
+        # Throttles are reported as the count since the previous emission.
+        metrics = self.metrics()
+        throttles = metrics['throttles'] - self.reported_throttles
+        self.reported_throttles = metrics['throttles']
+        print(dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': 'ReviewApp',
+                    'Dimensions': [['FunctionName']],
+                    'Metrics': [
+                        {'Name': 'DynamoDBRateLimit', 'Unit': 'Count/Second'},
+                        {'Name': 'DynamoDBThrottles', 'Unit': 'Count'}
+                    ]
+                }]
+            },
+            'FunctionName': function_name,
+            'DynamoDBRateLimit': metrics['rate'],
+            'DynamoDBThrottles': throttles
+        }))
+
+
+def retryable_cancellation(error):
+    # botocore does not retry a TransactionCanceledException, even when it was
+    # only caused by throttling or by a concurrent transaction on an item
+    if error.response['Error']['Code'] != 'TransactionCanceledException':
+        return False
+    reasons = {reason.get('Code') for reason in error.response.get('CancellationReasons', [])}
+    return bool(reasons & RETRY_REASONS) and 'ConditionalCheckFailed' not in reasons
+
+
+def transact_write(dynamodb, transact_items, max_attempts=10, base_delay=0.05, max_delay=2.0):
+    # transact_write_items, retried with full-jitter exponential backoff while
+    # it is cancelled for throttling or conflicts. Every attempt still goes
+    # through the limiter attached to the client, which has already slowed
+    # down for the throttle. Other errors (a failed condition) are raised.
+    attempt = 0
+    while True:
+        try:
+            return dynamodb.transact_write_items(TransactItems=transact_items)
+        except ClientError as e:
+            attempt += 1
+            if attempt >= max_attempts or not retryable_cancellation(e):
+                raise
+        time.sleep(random.uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+
+
+def limiter_from_env():
+    return AdaptiveRateLimiter(
+        rate=float(os.getenv("DYNAMODB_RATE", "500")),
+        min_rate=float(os.getenv("DYNAMODB_MIN_RATE", "10")),
+        max_rate=float(os.getenv("DYNAMODB_MAX_RATE", "5000"))
+    )
@@ -0,0 +1,66 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from common.jsoncodec import dumps
+
+# Every review gets a traceId and the upload time of its object (uploadedAt,
+# epoch ms) at ingest; both stay on the item (and in rebirth's S3 artifacts)
+# for the later stages. Each stage logs one span line per batch:
+#   {"span": stage, "start": ms, "durationMs": ..., "reviews": [[traceId, msSinceUpload], ...]}
+# where msSinceUpload is taken when the stage finished that review.
+# code/trace_report.py turns these lines into latency histograms.
+# Reviews per log line, which keeps a line of a large object far below the
+# CloudWatch event size limit
+MAX_SPAN_REVIEWS = 1000
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+def event_time_ms(record):
+    # eventTime of an S3 notification record, e.g. 2025-06-30T12:00:00.123Z
+    try:
+        value = record['eventTime'].replace('Z', '+00:00')
+        return int(datetime.fromisoformat(value).astimezone(timezone.utc).timestamp() * 1000)
+    except (KeyError, ValueError):
+        return now_ms()
+
+
+class Span:
+    def __init__(self, stage, **fields):
+        self.stage = stage
+        self.fields = fields
+        self.start = now_ms()
+        self.reviews = []
+        self.lock = threading.Lock()
+
+    def add(self, trace_id, uploaded_at):
+        # Called when the stage is done with one review
+        if trace_id is None or uploaded_at is None:
+            return
+        entry = [trace_id, now_ms() - int(uploaded_at)]
+        with self.lock:
+            self.reviews.append(entry)
+
+    def add_item(self, item):
+        # Same for a review in DynamoDB JSON (stream image or item)
+        if 'traceId' in item and 'uploadedAt' in item:
+            self.add(item['traceId']['S'], item['uploadedAt']['N'])
+
+    def emit(self, **fields):
+        with self.lock:
+            reviews, self.reviews = self.reviews, []
+        if not reviews:
+            return
+        end = now_ms()
+        for i in range(0, len(reviews), MAX_SPAN_REVIEWS):
+            # span comes first so the analyzer can pick the lines out of the log
+            print(dumps(dict({'span': self.stage}, **self.fields, start=self.start, durationMs=end - self.start,
+                             reviews=reviews[i:i + MAX_SPAN_REVIEWS], **fields)))
@@ -1,12 +1,32 @@
-import json
+import asyncio
 import os
 import boto3
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_plus
 from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 import nltk
 import uuid, math
-from spellchecker import SpellChecker
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from common.aggregates import counter_update
+from common.ban_filter import BanFilter
+from common.batch import GET_BATCH_SIZE, batch_get
+from common.compression import detect_compression, open_stream, stream_lines
+from common.config import get_parameter
+from common.errors import condition_failed
+from common.ingest_state import block_hash, changed_ranges, load_state, save_state, split_blocks
+from common.jobs import job_id, job_update, set_expected, start_job
+from common.jsoncodec import dumps, loads
+from common.product_stats import product_update
+from common.quarantine import load_quarantined, quarantine, release
+from common.search import IndexBuilder
+from common.spelling import SymSpell, load_frequencies
+from common.text_cache import TextCache
+from common.text_codec import encode_text
+from common.throttle import RETRY_CONFIG, limiter_from_env, transact_write
+from common.tracing import Span, event_time_ms, new_trace_id, now_ms
 
 #nltk.data.path.append(os.path.join(os.getcwd(), 'nltk_data'))
 print(nltk.data.path)
@@ -18,68 +38,574 @@ endpoint_url = None
 if os.getenv("STAGE") == "local":
     endpoint_url = "http://localhost.localstack.cloud:4566"
 
+# Number of DynamoDB writes kept in flight while lines are being preprocessed
+WRITE_CONCURRENCY = int(os.getenv("WRITE_CONCURRENCY", "16"))
+# Number of S3 objects from one event processed at the same time
+RECORD_CONCURRENCY = int(os.getenv("RECORD_CONCURRENCY", "4"))
+# With STATE_MACHINE_ARN set (setupnew.sh), written reviews are handed to the
+# workflow in batches of SFN_BATCH_SIZE, at most SFN_MAX_BATCHES per execution
+STATE_MACHINE_ARN = os.getenv("STATE_MACHINE_ARN")
+SFN_BATCH_SIZE = int(os.getenv("SFN_BATCH_SIZE", "25"))
+SFN_MAX_BATCHES = int(os.getenv("SFN_MAX_BATCHES", "40"))
+# Seconds between reloads of the banned reviewer filter
+BAN_FILTER_REFRESH = int(os.getenv("BAN_FILTER_REFRESH", "300"))
+# A re-uploaded object with a new ETag is read in full and only its changed
+# blocks are ingested, so with the default (full) every re-upload costs a GET of
+# the whole object, even when only a few lines were appended. INGEST_VERIFY=append
+# is for append-only objects: a larger object whose old last block is unchanged
+# is taken to be the old bytes plus new lines, and only those are read (edits
+# before the old end are missed)
+INGEST_VERIFY = os.getenv("INGEST_VERIFY", "full")
+
 s3 = boto3.client("s3", endpoint_url=endpoint_url)
 ssm = boto3.client("ssm", endpoint_url=endpoint_url)
-dynamodb = boto3.client("dynamodb",endpoint_url=endpoint_url)
+sfn = boto3.client("stepfunctions", endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb",endpoint_url=endpoint_url,
+                        config=Config(max_pool_connections=max(10, WRITE_CONCURRENCY * RECORD_CONCURRENCY)).merge(RETRY_CONFIG))
+# Every DynamoDB call goes through the adaptive limiter; it backs off on throttles
+# so bursts slow ingestion down instead of dropping reviews.
+limiter = limiter_from_env()
+limiter.attach(dynamodb)
+
+# Bump whenever tokenization, stopwords or lemmatization change. It is part of
+# every text cache key, so processed text from an older pipeline is never reused.
+PREPROCESS_VERSION = '1'
+
+stop_words = set(stopwords.words('english'))
+lemmatizer = WordNetLemmatizer()
+
+# SPELL_CORRECTION=symspell turns on spelling correction. The symmetric-delete
+# index is loaded from SPELLING_INDEX (built by code/build_spelling_index.py),
+# or built from pyspellchecker's word list when that file is missing.
+spell = None
+if os.getenv("SPELL_CORRECTION") == "symspell":
+    index_path = os.getenv("SPELLING_INDEX", os.path.join(os.path.dirname(__file__), 'spelling_index.bin'))
+    if os.path.exists(index_path):
+        spell = SymSpell.load(index_path)
+    else:
+        spell = SymSpell.build(load_frequencies())
+    PREPROCESS_VERSION += '+symspell'
+
+# Identical reviewText/summary strings are processed once per container, or once
+# overall when TEXT_CACHE_TABLE names a shared DynamoDB table (hash key textHash).
+text_cache = TextCache(
+    PREPROCESS_VERSION,
+    max_entries=int(os.getenv("TEXT_CACHE_SIZE", "50000")),
+    dynamodb=dynamodb,
+    table_name=os.getenv("TEXT_CACHE_TABLE")
+)
 
 def preprocess_text(text):
-    spell = SpellChecker()
+    return text_cache.get_or_compute(text, run_nlp)
+
+def run_nlp(text):
     tokens = word_tokenize(text.lower())
     
     # Remove stopwords and non-alpha tokens
-    stop_words = set(stopwords.words('english'))
     tokens = [word for word in tokens if word.isalpha() and word not in stop_words]
     
     # Correct spelling
-    # tokens = [spell.correction(word) if spell.correction(word) else word for word in tokens]
+    if spell is not None:
+        tokens = spell.correct_tokens(tokens)
     
     # Lemmatize
-    lemmatizer = WordNetLemmatizer()
     tokens = [lemmatizer.lemmatize(token) for token in tokens]
     
     return ' '.join(tokens)
 
-def handler(event, context):
-    bucket_name = ssm.get_parameter(Name='/review-app/buckets/reviews')['Parameter']['Value']
-    reviews_table = ssm.get_parameter(Name='/review-app/tables/reviews')['Parameter']['Value']
-    print("Insisde handler",event)
-    for record in event['Records']:
-        key = record['s3']['object']['key']
-        obj = s3.get_object(Bucket=bucket_name, Key=key)
-        # Process each line as a separate JSON object
-        for line in obj['Body'].read().decode('utf-8').splitlines():
+# punkt and WordNet load lazily on first use, which is not thread safe; load
+# them here before the record workers start
+run_nlp("Warming up the tokenizers")
+
+# COMPACT_TEXT=1 stores the processed fields as compressed binary attributes,
+# shrinking items, write units and the stream payload read by both consumers.
+compact_text = os.getenv("COMPACT_TEXT") == "1"
+
+ban_filter = None
+
+def get_ban_filter(table_name):
+    # Kept per container, so the banned set is scanned once per refresh period
+    global ban_filter
+    if ban_filter is None:
+        ban_filter = BanFilter(dynamodb, table_name, BAN_FILTER_REFRESH)
+    return ban_filter
+
+def review_id_of(review_data):
+    return f"{review_data['reviewerID']}-{review_data['asin']}-{review_data['unixReviewTime']}"
+
+def build_banned_item(review_data):
+    # Reviews by banned users are kept for the record but skip the NLP; the
+    # reviewStatus keeps them away from the profanity and sentiment consumers.
+    review_id = review_id_of(review_data)
+    processed_review = {
+        'reviewId' : {'S': review_id},
+        'reviewerID': {'S': str(review_data['reviewerID'])},
+        'asin': {'S': str(review_data['asin'])},
+        'reviewStatus': {'S': 'BANNED_USER'},
+        'sentiment': {'S': 'SKIPPED'}
+    }
+    value = review_data.get('overall')
+    if value is not None and not (isinstance(value, float) and math.isnan(value)):
+        processed_review['overall'] = {'N': str(value)}
+    return processed_review
+
+def build_item(review_data):
+    review_id = review_id_of(review_data)
+    processed_review = {
+        'reviewId' : {'S': review_id},
+        'reviewerID': {'S': str(review_data['reviewerID'])},
+        'asin': {'S': str(review_data['asin'])},
+        'processedreviewText': encode_text(preprocess_text(review_data['reviewText']), compact_text),
+        'processedSummary': encode_text(preprocess_text(review_data['summary']), compact_text),
+        'profanityCheck': {'BOOL': False},
+        'sentiment': {'S': 'PENDING'},
+        # code/backfill.py reprocesses reviews stamped with an older version
+        'preprocessVersion': {'S': PREPROCESS_VERSION}
+    }
+    value = review_data.get('overall')
+    if value is not None and not (isinstance(value, float) and math.isnan(value)):
+        processed_review['overall'] = {'N': str(value)}
+    return processed_review
+
+def write_review(processed_review, tables):
+    # The conditional put replaces the get_item/put_item pair and counts the
+    # review exactly once, in the same transaction. False means it already existed.
+    counters = {'ingested': 1}
+    if 'reviewStatus' in processed_review:
+        counters['skipped'] = 1
+    transact_items = [
+        {'Put': {
+            'TableName': tables['reviews'],
+            'Item': processed_review,
+            'ConditionExpression': 'attribute_not_exists(reviewId)'
+        }},
+        {'Update': counter_update(tables['aggregates'], counters)}
+    ]
+    # The product's review count and rating sum move with the review itself
+    if 'products' in tables and 'reviewStatus' not in processed_review:
+        product_counters = {'reviews': 1}
+        if 'overall' in processed_review:
+            product_counters['rated'] = 1
+            product_counters['overallSum'] = processed_review['overall']['N']
+        transact_items.append({'Update': product_update(tables['products'], processed_review['asin']['S'], product_counters)})
+    if 'jobId' in processed_review and 'reviewStatus' not in processed_review:
+        transact_items.append({'Update': job_update(tables['jobs'], processed_review['jobId']['S'], {'preprocessed': 1})})
+    try:
+        transact_write(dynamodb, transact_items)
+    except ClientError as e:
+        if condition_failed(e):
+            return False
+        raise
+    return True
+
+def is_edited(stored, processed_review):
+    # A line whose review is already stored from this same object but with
+    # other bytes was edited in place. Items stored before sourceHash was
+    # written are taken to be unchanged.
+    return ('sourceHash' in stored and 'sourceHash' in processed_review
+            and stored.get('sourceKey') == processed_review.get('sourceKey')
+            and stored['sourceHash'] != processed_review['sourceHash'])
+
+def edited(processed_review, tables):
+    stored = dynamodb.get_item(
+        TableName=tables['reviews'],
+        Key={'reviewerID': processed_review['reviewerID'], 'reviewId': processed_review['reviewId']},
+        ProjectionExpression='sourceKey, sourceHash'
+    ).get('Item', {})
+    return is_edited(stored, processed_review)
+
+def stored_reviews(keys, tables):
+    # reviewId -> stored source fields of the reviews among keys that already
+    # exist. One BatchGetItem per GET_BATCH_SIZE lines costs half a read unit
+    # per key (found or not), where a duplicate found only by the conditional
+    # put has paid for the NLP and for a cancelled transaction, which still
+    # consumes the write units of all its actions. Eventually consistent: a
+    # review written moments ago may be missed, and the put still catches it.
+    unique = list({key['reviewId']['S']: key for key in keys}.values())
+    items = batch_get(dynamodb, tables['reviews'], unique, ProjectionExpression='reviewId, sourceKey, sourceHash')
+    return {item['reviewId']['S']: item for item in items}
+
+def failure(offset, line, stage, error):
+    return {
+        'offset': offset,
+        'length': len(line),
+        'line': line.decode('utf-8', errors='replace'),
+        'stage': stage,
+        'error': str(error)
+    }
+
+async def drain_writes(queue, executor, tables, stats, written_keys, failures, index, span):
+    loop = asyncio.get_running_loop()
+    while True:
+        entry = await queue.get()
+        try:
+            if entry is None:
+                return
+            offset, line, processed_review = entry
+            try:
+                written = await loop.run_in_executor(executor, write_review, processed_review, tables)
+            except Exception as e:
+                print(f"Exception occurred: {e}")
+                stats['failed'] += 1
+                failures.append(failure(offset, line, 'write', e))
+                continue
+            if written:
+                stats['written'] += 1
+                if 'reviewStatus' in processed_review:
+                    stats['skipped'] += 1
+                    continue
+                if written_keys is not None:
+                    written_keys.append((offset, line, {
+                        'reviewerID': processed_review['reviewerID']['S'],
+                        'reviewId': processed_review['reviewId']['S']
+                    }))
+                if index is not None:
+                    index.add(processed_review)
+                if span is not None:
+                    span.add_item(processed_review)
+            elif 'sourceHash' in processed_review and await loop.run_in_executor(executor, edited, processed_review, tables):
+                # Stored reviews are not rewritten; the edit is reported instead
+                # of being counted as a duplicate
+                print(f"Line at {offset} changed review {processed_review['reviewId']['S']}, keeping the stored review")
+                stats['changed'] += 1
+            else:
+                stats['duplicates'] += 1
+        finally:
+            queue.task_done()
+
+async def ingest_lines(lines, tables, concurrency=WRITE_CONCURRENCY, written_keys=None, failures=None, index=None,
+                       source_key=None, job=None, uploaded_at=None, span=None):
+    # The producer parses and preprocesses lines while `concurrency` writers
+    # drain a bounded queue; a full queue pauses the producer, so memory stays
+    # flat when DynamoDB is slower than the NLP. Lines are parsed in blocks of
+    # GET_BATCH_SIZE whose stored reviews are looked up first (stored_reviews),
+    # so duplicates cost neither NLP nor a write. lines are (byte offset, raw
+    # line) pairs. (offset, line, key) of newly written reviews are appended to
+    # written_keys, and lines that could not be stored to failures, when lists
+    # are passed;
+    # newly written reviews are added to the search index builder if given.
+    # With source_key, items record where their raw line is so it can be read
+    # back (read_line) when the review has to be processed again, and with
+    # job every stage counts the review towards that job. Each review gets its
+    # own traceId and the upload time of the object (now when not given);
+    # written ones are added to span. Lines whose review is stored from an
+    # earlier version of the same object with other bytes count as changed.
+    stats = {'written': 0, 'duplicates': 0, 'changed': 0, 'failed': 0, 'skipped': 0}
+    failures = [] if failures is None else failures
+    uploaded_at = uploaded_at or now_ms()
+    bans = get_ban_filter(tables['users']) if 'users' in tables else None
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        writers = [
+            asyncio.create_task(drain_writes(queue, executor, tables, stats, written_keys, failures, index, span))
+            for _ in range(concurrency)
+        ]
+        async def preprocess_block(block):
+            # Lines whose review is already stored skip the NLP and the write
+            keys = []
+            for offset, line, review_data in block:
+                try:
+                    keys.append({'reviewerID': {'S': str(review_data['reviewerID'])},
+                                 'reviewId': {'S': review_id_of(review_data)}})
+                except Exception:
+                    pass  # Reported as a preprocess failure below
+            stored = await loop.run_in_executor(executor, stored_reviews, keys, tables) if keys else {}
+            for offset, line, review_data in block:
+                try:
+                    review_id = review_id_of(review_data)
+                    if review_id in stored:
+                        source = {'sourceKey': {'S': source_key}, 'sourceHash': {'S': block_hash(line)}} if source_key else {}
+                        if is_edited(stored[review_id], source):
+                            print(f"Line at {offset} changed review {review_id}, keeping the stored review")
+                            stats['changed'] += 1
+                        else:
+                            stats['duplicates'] += 1
+                        continue
+                    if bans is not None and bans.is_banned(str(review_data['reviewerID'])):
+                        processed_review = build_banned_item(review_data)
+                    else:
+                        processed_review = build_item(review_data)
+                except Exception as e:
+                    print(f"Exception occurred: {e}")
+                    stats['failed'] += 1
+                    failures.append(failure(offset, line, 'preprocess', e))
+                    continue
+                if source_key is not None:
+                    processed_review['sourceKey'] = {'S': source_key}
+                    processed_review['sourceOffset'] = {'N': str(offset)}
+                    processed_review['sourceLength'] = {'N': str(len(line))}
+                    processed_review['sourceHash'] = {'S': block_hash(line)}
+                if job is not None:
+                    processed_review['jobId'] = {'S': job}
+                processed_review['traceId'] = {'S': new_trace_id()}
+                processed_review['uploadedAt'] = {'N': str(uploaded_at)}
+                await queue.put((offset, line, processed_review))
+                # Let the writers pick the item up before the next line is preprocessed
+                await asyncio.sleep(0)
+
+        block = []
+        for offset, line in lines:
             if not line.strip():
                 continue  # Skip empty lines
 
             try:
-                review_data = json.loads(line)
-            except json.JSONDecodeError as e:
+                review_data = loads(line)
+            except ValueError as e:
                 print(f"Skipping invalid JSON line: {e}")
+                stats['failed'] += 1
+                failures.append(failure(offset, line, 'parse', e))
                 continue
+            block.append((offset, line, review_data))
+            if len(block) == GET_BATCH_SIZE:
+                await preprocess_block(block)
+                block = []
+        if block:
+            await preprocess_block(block)
+        for _ in writers:
+            await queue.put(None)
+        await asyncio.gather(*writers)
+    return stats
+
+def split_lines(data, base=0):
+    # Yields (byte offset, line) for every line of an NDJSON object, so a
+    # failed line can be found again in the source without re-reading it.
+    # base is the object offset of data[0] when data is a range of the object.
+    offset = 0
+    while offset < len(data):
+        end = data.find(b'\n', offset)
+        if end == -1:
+            end = len(data)
+        yield base + offset, data[offset:end].rstrip(b'\r')
+        offset = end + 1
+
+def get_tables():
+    return {
+        'reviews': get_parameter(ssm, '/review-app/tables/reviews'),
+        'users': get_parameter(ssm, '/review-app/tables/users'),
+        'aggregates': get_parameter(ssm, '/review-app/tables/aggregates'),
+        'quarantine': get_parameter(ssm, '/review-app/tables/quarantine'),
+        'ingest_state': get_parameter(ssm, '/review-app/tables/ingest-state'),
+        'products': get_parameter(ssm, '/review-app/tables/products'),
+        'search': get_parameter(ssm, '/review-app/tables/search'),
+        'jobs': get_parameter(ssm, '/review-app/tables/jobs')
+    }
+
+def start_executions(review_keys, batch_size=SFN_BATCH_SIZE, max_batches=SFN_MAX_BATCHES):
+    # One execution covers up to max_batches * batch_size reviews; its Map state
+    # fans the batches out to the profanity and sentiment functions.
+    batches = [{'reviews': review_keys[i:i + batch_size]} for i in range(0, len(review_keys), batch_size)]
+    executions = []
+    for i in range(0, len(batches), max_batches):
+        response = sfn.start_execution(
+            stateMachineArn=STATE_MACHINE_ARN,
+            name=str(uuid.uuid4()),
+            input=dumps({'batches': batches[i:i + max_batches]})
+        )
+        executions.append(response['executionArn'])
+    return executions
+
+def ingest(lines, tables, failures, source_key=None, job=None, uploaded_at=None):
+    written_keys = [] if STATE_MACHINE_ARN else None
+    index = IndexBuilder(dynamodb, tables['search']) if 'search' in tables else None
+    span = Span('pre_process', sourceKey=source_key)
+    stats = asyncio.run(ingest_lines(lines, tables, written_keys=written_keys, failures=failures, index=index,
+                                     source_key=source_key, job=job, uploaded_at=uploaded_at, span=span))
+    span.emit()
+    if index is not None:
+        # The index is only for searching; the reviews still go on to the
+        # workflow and failed lines are still recorded without it
+        try:
+            index.flush()
+        except Exception as e:
+            print(f"Could not write the search index: {e}")
+            stats['indexFailed'] = True
+        stats['indexUpdates'] = index.updates
+    if written_keys:
+        dispatch(written_keys, failures, stats)
+    return stats
+
+def dispatch(written_keys, failures, stats):
+    # The reviews are already written, so a retry of the object would only see
+    # duplicates; when the workflow cannot be started they are quarantined as
+    # 'dispatch' failures instead, and replay_quarantined starts it for them
+    try:
+        stats['executions'] = len(start_executions([key for _, _, key in written_keys]))
+    except Exception as e:
+        print(f"Could not start executions for {len(written_keys)} reviews: {e}")
+        stats['undispatched'] = len(written_keys)
+        failures.extend(failure(offset, line, 'dispatch', e) for offset, line, _ in written_keys)
+
+def read_range(bucket_name, key, offset, length):
+    obj = s3.get_object(Bucket=bucket_name, Key=key, Range=f"bytes={offset}-{offset + length - 1}")
+    return obj['Body'].read()
+
+def read_lines(bucket_name, key, ranges):
+    # Reads back lines of an object by (offset, length), e.g. quarantined lines
+    # too large to store; returns {offset: line}. Offsets in compressed objects
+    # count decompressed bytes, so those are found in one pass over the stream.
+    if not ranges:
+        return {}
+    head = s3.head_object(Bucket=bucket_name, Key=key)
+    compression = detect_compression(key, head.get('ContentEncoding'), head.get('ContentType'))
+    if compression is None:
+        return {offset: read_range(bucket_name, key, offset, length) for offset, length in ranges}
+    wanted = {offset for offset, _ in ranges}
+    lines = {}
+    body = s3.get_object(Bucket=bucket_name, Key=key)['Body']
+    for line_offset, line in stream_lines(open_stream(body, compression)):
+        if line_offset in wanted:
+            lines[line_offset] = line
+            if len(lines) == len(wanted):
+                return lines
+    raise ValueError(f"No lines at offsets {sorted(wanted - set(lines))} in {key}")
+
+def read_line(bucket_name, key, offset, length):
+    return read_lines(bucket_name, key, [(offset, length)])[offset]
+
+def read_object(bucket_name, key, tables):
+    # Returns the (offset, line) pairs still to be ingested, the ingest state
+    # to store afterwards (None when nothing changed) and how it was read
+    head = s3.head_object(Bucket=bucket_name, Key=key)
+    size = head['ContentLength']
+    state = load_state(dynamodb, tables['ingest_state'], key)
+
+    if state and state['etag'] == head['ETag']:
+        return [], None, {'mode': 'unchanged', 'bytesRead': 0, 'etag': head['ETag']}
+
+    compression = detect_compression(key, head.get('ContentEncoding'), head.get('ContentType'))
+    if compression:
+        # Decompressed while the lines are consumed, never held in full
+        body = s3.get_object(Bucket=bucket_name, Key=key)['Body']
+        new_state = {'processedBytes': size, 'blocks': [], 'etag': head['ETag']}
+        return stream_lines(open_stream(body, compression)), new_state, {'mode': compression, 'bytesRead': size, 'etag': head['ETag']}
+
+    # The ETag changed, so a same-size object has different bytes somewhere
+    if state and state['blocks'] and INGEST_VERIFY == 'append' and size > state['processedBytes']:
+        # The last block is read again with the new bytes, so the stored
+        # blocks stay the same as a full split of the object would give
+        last_start, last_end, last_hash = state['blocks'][-1]
+        tail = read_range(bucket_name, key, last_start, size - last_start)
+        if block_hash(tail[:last_end - last_start]) == last_hash:
+            lines = split_lines(tail[last_end - last_start:], last_end)
+            new_state = {'processedBytes': size, 'blocks': state['blocks'][:-1] + split_blocks(tail, last_start),
+                         'etag': head['ETag']}
+            return lines, new_state, {'mode': 'append', 'bytesRead': len(tail), 'etag': head['ETag']}
+
+    data = s3.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+    new_state = {'processedBytes': len(data), 'blocks': split_blocks(data), 'etag': head['ETag']}
+    if not state:
+        return split_lines(data), new_state, {'mode': 'full', 'bytesRead': len(data), 'etag': head['ETag']}
+    # Only blocks whose bytes changed are ingested again
+    lines = [
+        line for start, end in changed_ranges(state['blocks'], new_state['blocks'])
+        for line in split_lines(data[start:end], start)
+    ]
+    return lines, new_state, {'mode': 'changed', 'bytesRead': len(data), 'etag': head['ETag']}
+
+def process_object(bucket_name, key, tables, uploaded_at=None):
+    lines, new_state, read_stats = read_object(bucket_name, key, tables)
+    # code/job_status.py and the tests wait on this job instead of sleeping
+    job = job_id(key, read_stats['etag'])
+    start_job(dynamodb, tables['jobs'], job, sourceKey=key, mode=read_stats['mode'])
+    # Process each line as a separate JSON object
+    failures = []
+    try:
+        stats = ingest(lines, tables, failures, key, job, uploaded_at)
+    finally:
+        # Lines that failed are kept with their offset and error instead of
+        # being dropped, so replay_quarantined can retry just those; this
+        # also runs when ingest itself fails part way
+        quarantined = quarantine(dynamodb, tables['quarantine'], key, failures) if failures else 0
+    stats['quarantined'] = quarantined
+    if new_state is not None:
+        save_state(dynamodb, tables['ingest_state'], key, new_state)
+    # Only newly written, non-banned reviews go on to profanity and sentiment.
+    # An unchanged object is a redelivery of a job that already counted its
+    # reviews (and may still be running), so it leaves the job alone.
+    if read_stats['mode'] != 'unchanged':
+        set_expected(dynamodb, tables['jobs'], job, stats['written'] - stats['skipped'],
+                     written=stats['written'], duplicates=stats['duplicates'], changed=stats['changed'],
+                     failed=stats['failed'], skipped=stats['skipped'])
+    stats.update(read_stats)
+    stats['jobId'] = job
+    return stats
+
+def replay_quarantined(bucket_name, tables, source_key=None):
+    # Reprocesses quarantined lines (of one source object, or all of them).
+    # Lines that go through are released; lines that fail again stay
+    # quarantined with the new error and one more attempt.
+    entries = load_quarantined(dynamodb, tables['quarantine'], source_key)
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry['sourceKey'], []).append(entry)
+
+    results = []
+    for key, group in groups.items():
+        # Lines too large to quarantine are read back from the object, all in one pass
+        stored = read_lines(bucket_name, key, [(entry['offset'], entry['length'])
+                                               for entry in group if entry['line'] is None])
+        lines = [
+            (entry['offset'], entry['line'].encode('utf-8') if entry['line'] is not None else stored[entry['offset']])
+            for entry in group
+        ]
+        failures = []
+        # Reviews stored before their workflow could be started are only
+        # dispatched again; everything else is ingested again
+        stages = {entry['offset']: entry['stage'] for entry in group}
+        undispatched = [(offset, line) for offset, line in lines if stages[offset] == 'dispatch']
+        stats = ingest([(offset, line) for offset, line in lines if stages[offset] != 'dispatch'], tables, failures, key)
+        if undispatched:
+            dispatch([(offset, line, review_key(line)) for offset, line in undispatched], failures, stats)
+        attempts = {entry['offset']: entry['attempts'] for entry in group}
+        for entry in failures:
+            entry['attempts'] = attempts[entry['offset']] + 1
+        failed = {entry['offset'] for entry in failures}
+        stats['released'] = release(dynamodb, tables['quarantine'], key,
+                                    [entry['offset'] for entry in group if entry['offset'] not in failed])
+        stats['quarantined'] = quarantine(dynamodb, tables['quarantine'], key, failures) if failures else 0
+        results.append({'key': key, **stats})
+    return results
+
+def review_key(line):
+    review_data = loads(line)
+    return {'reviewerID': str(review_data['reviewerID']), 'reviewId': review_id_of(review_data)}
+
+def handler(event, context):
+    bucket_name = get_parameter(ssm, '/review-app/buckets/reviews')
+    tables = get_tables()
+    print("Insisde handler",event)
+
+    # {"replay": {"sourceKey": ...}} comes from code/replay_quarantine.py
+    if 'replay' in event:
+        results = replay_quarantined(bucket_name, tables, event['replay'].get('sourceKey'))
+        for result in results:
+            print(dumps(result))
+        limiter.emit_metrics('pre-process')
+        return {'statusCode': 200, 'results': results}
+
+    keys = [unquote_plus(record['s3']['object']['key']) for record in event['Records']]
+    uploaded = [event_time_ms(record) for record in event['Records']]
+
+    # Objects are processed side by side; a slow or broken file only affects
+    # its own entry in the results until all of them are done.
+    results = []
+    with ThreadPoolExecutor(max_workers=RECORD_CONCURRENCY) as executor:
+        futures = [executor.submit(process_object, bucket_name, key, tables, uploaded_at)
+                   for key, uploaded_at in zip(keys, uploaded)]
+        for key, future in zip(keys, futures):
             try:
-                review_id = f"{review_data['reviewerID']}-{review_data['asin']}-{review_data['unixReviewTime']}"
-                response = dynamodb.get_item(
-                    TableName=reviews_table,
-                    Key={
-                        'reviewerID': {'S': str(review_data['reviewerID'])},
-                        'reviewId': {'S': review_id}
-                        })
-                if 'Item' not in response:
-                    processed_review = {
-                        'reviewId' : {'S': f"{review_data['reviewerID']}-{review_data['asin']}-{review_data['unixReviewTime']}"},
-                        'reviewerID': {'S': str(review_data['reviewerID'])},
-                        'processedreviewText': {'S': preprocess_text(review_data['reviewText'])},
-                        'processedSummary': {'S': preprocess_text(review_data['summary'])},
-                        'overall': {'N': str(review_data['overall'])},
-                        'profanityCheck': {'BOOL': False},
-                        'sentiment': {'S': 'PENDING'}
-                    }
-                    value = review_data.get('overall')
-                    if value is not None and not (isinstance(value, float) and math.isnan(value)):
-                        processed_review['overall'] = {'N': str(value)}
-
-                    dynamodb.put_item(TableName=reviews_table, Item=processed_review)
+                results.append({'key': key, **future.result()})
             except Exception as e:
-                print(f"Exception occurred: {e}")
-                continue
-    return {'statusCode': 200}
+                print(f"Failed to process {key}: {e}")
+                results.append({'key': key, 'error': str(e)})
+    for result in results:
+        print(dumps(result))
+    print(dumps({'textCache': text_cache.stats(), 'banFilter': ban_filter.stats() if ban_filter else None}))
+    limiter.emit_metrics('pre-process')
+    # Failing the invocation makes Lambda retry the event; objects that were
+    # completed are skipped then by their saved ingest state (same ETag)
+    failed = [result['key'] for result in results if 'error' in result]
+    if failed:
+        raise RuntimeError(f"Failed to process {failed}")
+    return {'statusCode': 200, 'results': results}
@@ -1,76 +1,224 @@
 import os
+import re
 import boto3
+from concurrent.futures import ThreadPoolExecutor
+from botocore.config import Config
 from profanityfilter import ProfanityFilter
+from profanityfilter.profanityfilter import ENDS_WITH_WORD_CHAR, STARTS_WITH_WORD_CHAR
+from botocore.exceptions import ClientError
+from common.aggregates import counter_update
+from common.config import get_parameter
+from common.errors import condition_failed
+from common.jobs import job_update
+from common.product_stats import product_update, review_asin
+from common.queries import BANNED_FLAG
+from common.sketches import SketchWriter
+from common.stream import load_reviews, new_reviews, partition_by_reviewer, process_partitions
+from common.text_codec import decode_text
+from common.throttle import RETRY_CONFIG, limiter_from_env, transact_write
+from common.tracing import Span
 
 pf = ProfanityFilter()
 
+def compile_profanity(pf):
+    # ProfanityFilter.is_profane re-pluralizes its word list and compiles one
+    # regex per word on every call (~50 ms, all of it holding the GIL). The text
+    # is profane as soon as any of those regexes matches it, so the same word
+    # patterns joined into one alternation give the same answer.
+    patterns = []
+    for word in pf.get_profane_words():
+        if STARTS_WITH_WORD_CHAR.search(word):
+            word = r'\b' + word
+        if ENDS_WITH_WORD_CHAR.search(word):
+            word = word + r'\b'
+        patterns.append(word)
+    return re.compile('|'.join(patterns), re.IGNORECASE)
+
+profanity_regex = compile_profanity(pf)
+
+def is_profane(text):
+    return profanity_regex.search(text) is not None
+
 endpoint_url = None
 if os.getenv("STAGE") == "local":
     endpoint_url = "http://localhost.localstack.cloud:4566"
 
+# Reviewers within one stream batch are handled on this many threads
+PARTITION_CONCURRENCY = int(os.getenv("PARTITION_CONCURRENCY", "8"))
+
 s3 = boto3.client("s3", endpoint_url=endpoint_url)
 ssm = boto3.client("ssm", endpoint_url=endpoint_url)
-dynamodb = boto3.client("dynamodb",endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb",endpoint_url=endpoint_url,
+                        config=Config(max_pool_connections=max(10, PARTITION_CONCURRENCY)).merge(RETRY_CONFIG))
+limiter = limiter_from_env()
+limiter.attach(dynamodb)
 
 
-def handler(event, context):
-    reviews_table = ssm.get_parameter(Name='/review-app/tables/reviews')['Parameter']['Value']
-    users_table = ssm.get_parameter(Name='/review-app/tables/users')['Parameter']['Value']
+def profane_terms(text):
+    return [match.group(0).lower() for match in profanity_regex.finditer(text)]
+
+def check_review(record, tables, sketches=None, span=None):
+    review_id = record['dynamodb']['Keys']['reviewId']['S']
+    reviewer_id = record['dynamodb']['Keys']['reviewerID']['S']
+    review = record['dynamodb']['NewImage']
+    
+    # Check for profanity
+    terms = profane_terms(decode_text(review['processedreviewText'])) + profane_terms(decode_text(review['processedSummary']))
+    has_profanity = bool(terms)
+    
+    # Update review with profanity check result. The profanityChecked marker makes
+    # the whole transaction a no-op when a retried batch delivers the record again,
+    # so unpoliteCount and the counters are only ever incremented once per review.
+    # profaneReviewer is only set on profane reviews, which keeps ProfaneIndex sparse.
+    review_update = 'SET profanityCheck = :val, profanityChecked = :true'
+    review_values = {':val': {'BOOL': has_profanity}, ':true': {'BOOL': True}}
+    if has_profanity:
+        review_update += ', profaneReviewer = :reviewer'
+        review_values[':reviewer'] = {'S': reviewer_id}
+    transact_items = [{'Update': {
+        'TableName': tables['reviews'],
+        'Key': {
+            'reviewerID': {'S': reviewer_id},
+            'reviewId': {'S': review_id}
+            },
+        'UpdateExpression': review_update,
+        'ConditionExpression': 'attribute_not_exists(profanityChecked)',
+        'ExpressionAttributeValues': review_values
+    }}]
+
+    # Update or Insert default values for new users, incrementing
+    # unpoliteCount only if profanity is found
+    if has_profanity:
+        update_expression = 'SET banned = if_not_exists(banned, :default_banned) ADD unpoliteCount :inc'
+        expression_values = {':default_banned': {'BOOL': False}, ':inc': {'N': '1'}}
+    else:
+        update_expression = '''
+            SET unpoliteCount = if_not_exists(unpoliteCount, :default_count),
+                banned = if_not_exists(banned, :default_banned)
+        '''
+        expression_values = {':default_count': {'N': '0'}, ':default_banned': {'BOOL': False}}
+    transact_items.append({'Update': {
+        'TableName': tables['users'],
+        'Key': {'reviewerID': {'S': reviewer_id}},
+        'UpdateExpression': update_expression,
+        'ExpressionAttributeValues': expression_values
+    }})
+    if has_profanity:
+        transact_items.append({'Update': counter_update(tables['aggregates'], {'profane': 1})})
+    asin = review_asin(review)
+    if asin:
+        product_counters = {'checked': 1, 'profane': 1} if has_profanity else {'checked': 1}
+        transact_items.append({'Update': product_update(tables['products'], asin, product_counters)})
+    if 'jobId' in review:
+        transact_items.append({'Update': job_update(tables['jobs'], review['jobId']['S'], {'profanityChecked': 1})})
+
+    try:
+        transact_write(dynamodb, transact_items)
+    except ClientError as e:
+        if not condition_failed(e):
+            raise
+        # Already applied; the ban check below still runs in case the
+        # earlier attempt failed after the transaction
+    else:
+        if span:
+            span.add_item(review)
+        # Sketched only once per review, like the counters
+        if sketches:
+            sketches.add_distinct('reviewers', reviewer_id)
+            if terms:
+                sketches.add_terms('profane-terms', terms)
+
+    if has_profanity:
+        ban_if_needed(reviewer_id, tables)
+
+def ban_if_needed(reviewer_id, tables):
+    user = dynamodb.get_item(
+        TableName=tables['users'],
+        Key={'reviewerID': {'S': reviewer_id}},
+        ConsistentRead=True
+    )['Item']
     
-    for record in event['Records']:
-        if record['eventName'] == 'INSERT':
-            review_id = record['dynamodb']['Keys']['reviewId']['S']
-            reviewer_id = record['dynamodb']['Keys']['reviewerID']['S']
-            review = record['dynamodb']['NewImage']
-            
-            # Check for profanity
-            has_profanity = (
-                pf.is_profane(review['processedreviewText']['S']) or 
-                pf.is_profane(review['processedSummary']['S'])
-            )
-            
-            # Update review with profanity check result
-            dynamodb.update_item(
-                TableName=reviews_table,
-                Key={
-                    'reviewerID': {'S': reviewer_id},
-                    'reviewId': {'S': review_id}
-                    },
-                UpdateExpression='SET profanityCheck = :val',
-                ExpressionAttributeValues={':val': {'BOOL': has_profanity}}
-            )
-            update_expression = '''
-                SET unpoliteCount = if_not_exists(unpoliteCount, :default_count),
-                    banned = if_not_exists(banned, :default_banned)
-            '''
-            expression_values = {
-                ':default_count': {'N': '0'},
-                ':default_banned': {'BOOL': False}
-            }
-
-            # Increment unpoliteCount only if profanity is found
-            if has_profanity:
-                update_expression += ' ADD unpoliteCount :inc'
-                expression_values[':inc'] = {'N': '1'}
-
-            # Update or Insert default values for new users
-            response = dynamodb.update_item(
-                TableName=users_table,
-                Key={'reviewerID': {'S': reviewer_id}},
-                UpdateExpression=update_expression,
-                ExpressionAttributeValues=expression_values,
-                ReturnValues='ALL_NEW'
-            )
-            
-            # Get the updated unpolite count
-            unpolite_count = int(response['Attributes'].get('unpoliteCount', {'N': '0'})['N'])
-
-            # Ban user if unpoliteCount exceeds threshold (e.g., 3)
-            if unpolite_count > 3:
-                dynamodb.update_item(
-                    TableName=users_table,
-                    Key={'reviewerID': {'S': reviewer_id}},
-                    UpdateExpression='SET banned = :true',
-                    ExpressionAttributeValues={':true': {'BOOL': True}}
-                )
-    return {'statusCode': 200}
+    # Get the updated unpolite count
+    unpolite_count = int(user.get('unpoliteCount', {'N': '0'})['N'])
+
+    # Ban user if unpoliteCount exceeds threshold (e.g., 3)
+    # Only the update that flips the flag counts the user as banned
+    if unpolite_count > 3 and not user['banned']['BOOL']:
+        try:
+            transact_write(dynamodb, [
+                {'Update': {
+                    'TableName': tables['users'],
+                    'Key': {'reviewerID': {'S': reviewer_id}},
+                    # bannedFlag only exists on banned users (sparse BannedIndex)
+                    'UpdateExpression': 'SET banned = :true, bannedFlag = :flag',
+                    'ConditionExpression': 'banned = :false',
+                    'ExpressionAttributeValues': {
+                        ':true': {'BOOL': True},
+                        ':false': {'BOOL': False},
+                        ':flag': {'S': BANNED_FLAG}
+                    }
+                }},
+                {'Update': counter_update(tables['aggregates'], {'banned': 1})}
+            ])
+        except ClientError as e:
+            if not condition_failed(e):
+                raise
+
+def get_tables():
+    return {
+        'reviews': get_parameter(ssm, '/review-app/tables/reviews'),
+        'users': get_parameter(ssm, '/review-app/tables/users'),
+        'aggregates': get_parameter(ssm, '/review-app/tables/aggregates'),
+        'products': get_parameter(ssm, '/review-app/tables/products'),
+        'sketches': get_parameter(ssm, '/review-app/tables/sketches'),
+        'jobs': get_parameter(ssm, '/review-app/tables/jobs')
+    }
+
+def check_records(records, tables):
+    # Reviewers are independent of each other, so their records are checked in
+    # parallel; within a reviewer the order is kept, which the unpoliteCount and
+    # ban logic rely on.
+    partitions = partition_by_reviewer(records)
+    if not partitions:
+        return []
+    sketches = SketchWriter(dynamodb, tables['sketches'], 'profanity')
+    span = Span('profanity')
+    with ThreadPoolExecutor(max_workers=min(PARTITION_CONCURRENCY, len(partitions))) as executor:
+        failures = process_partitions(executor, partitions, lambda record: check_review(record, tables, sketches, span), 'check')
+    span.emit(failed=len(failures))
+    # Sketches are approximate anyway; losing one invocation's part is better
+    # than failing (and re-counting) a batch whose reviews are all written
+    try:
+        sketches.flush()
+    except Exception as e:
+        print(f"Could not write sketches: {e}")
+    return failures
+
+def handle_batch(event):
+    # Step Functions Map iteration: {'reviews': [{'reviewerID', 'reviewId'}, ...]}.
+    # The same batch is returned for the SentimentAnalysis step; a failure fails
+    # the task so the state's Retry runs it again (already checked reviews are
+    # skipped by the profanityChecked condition).
+    tables = get_tables()
+    records = load_reviews(dynamodb, tables['reviews'], event['reviews'])
+    failures = check_records(records, tables)
+    limiter.emit_metrics('profanity')
+    if failures:
+        raise RuntimeError(f"Profanity check failed for {[f['itemIdentifier'] for f in failures]}")
+    return {'reviews': event['reviews']}
+
+def handler(event, context):
+    if 'reviews' in event:
+        return handle_batch(event)
+
+    # MODIFY records caused by our own updates end here, before any SSM or
+    # DynamoDB call is made
+    records = new_reviews(event, 'profanity')
+    if not records:
+        return {'batchItemFailures': []}
+
+    # Failed records are reported back (ReportBatchItemFailures) so Lambda only
+    # retries from the first failed sequence number.
+    failures = check_records(records, get_tables())
+    limiter.emit_metrics('profanity')
+    return {'batchItemFailures': failures}
@@ -2,19 +2,37 @@ import os
 import boto3
 from nltk.sentiment import SentimentIntensityAnalyzer
 import nltk
+from botocore.exceptions import ClientError
+from common.aggregates import counter_update
+from common.config import get_parameter
+from common.errors import condition_failed
+from common.jobs import job_update
+from common.product_stats import product_update, review_asin
+from common.queries import sentiment_label
+from common.sketches import SketchWriter
+from common.stream import load_reviews, new_reviews
+from common.text_codec import decode_text
+from common.throttle import RETRY_CONFIG, limiter_from_env, transact_write
+from common.tracing import Span
 
 nltk.data.path.append(os.path.join(os.getcwd(), 'nltk_data'))
 
 
 sia = SentimentIntensityAnalyzer()
 
+# Bump whenever the analyzer or the thresholds in get_sentiment change;
+# code/backfill.py relabels reviews stamped with an older version
+SENTIMENT_VERSION = '1'
+
 endpoint_url = None
 if os.getenv("STAGE") == "local":
     endpoint_url = "http://localhost.localstack.cloud:4566"
 
 s3 = boto3.client("s3", endpoint_url=endpoint_url)
 ssm = boto3.client("ssm", endpoint_url=endpoint_url)
-dynamodb = boto3.client("dynamodb",endpoint_url=endpoint_url)
+dynamodb = boto3.client("dynamodb",endpoint_url=endpoint_url, config=RETRY_CONFIG)
+limiter = limiter_from_env()
+limiter.attach(dynamodb)
 
 
 def get_sentiment(text):
@@ -26,20 +44,102 @@ def get_sentiment(text):
     else:
         return 'NEUTRAL'
 
-def handler(event, context):
-    reviews_table = ssm.get_parameter(Name='/review-app/tables/reviews')['Parameter']['Value']
+def analyze_review(record, tables, sketches=None, span=None):
+    review_id = record['dynamodb']['Keys']['reviewId']['S']
+    reviewer_id = record['dynamodb']['Keys']['reviewerID']['S']
+    review = record['dynamodb']['NewImage']
+    
+    text = decode_text(review['processedreviewText']) + " " + decode_text(review['processedSummary'])
+    overall_sentiment = get_sentiment(text)
     
-    for record in event['Records']:
-        if record['eventName'] == 'INSERT':
-            review_id = record['dynamodb']['Keys']['reviewId']['S']
-            review = record['dynamodb']['NewImage']
-            
-            overall_sentiment = get_sentiment(review['processedreviewText']['S'] + " " + review['processedSummary']['S'])
-            
-            dynamodb.update_item(
-                TableName=reviews_table,
-                Key={'reviewId': {'S': review_id}},
-                UpdateExpression='SET sentiment = :sent',
-                ExpressionAttributeValues={':sent': {'S': overall_sentiment}}
-            )
-    return {'statusCode': 200}
\ No newline at end of file
+    # Setting the label and counting it happen together, and only while
+    # the review is still PENDING so a replayed record is not counted twice
+    transact_items = [
+        {'Update': {
+            'TableName': tables['reviews'],
+            'Key': {
+                'reviewerID': {'S': reviewer_id},
+                'reviewId': {'S': review_id}
+                },
+            # sentimentLabel keys the sparse SentimentIndex
+            'UpdateExpression': 'SET sentiment = :sent, sentimentLabel = :label, sentimentVersion = :version',
+            'ConditionExpression': 'sentiment = :pending',
+            'ExpressionAttributeValues': {
+                ':sent': {'S': overall_sentiment},
+                ':label': {'S': sentiment_label(overall_sentiment, review_id)},
+                ':pending': {'S': 'PENDING'},
+                ':version': {'S': SENTIMENT_VERSION}
+            }
+        }},
+        {'Update': counter_update(tables['aggregates'], {overall_sentiment.lower(): 1})}
+    ]
+    asin = review_asin(review)
+    if asin:
+        transact_items.append({'Update': product_update(tables['products'], asin, {overall_sentiment.lower(): 1})})
+    if 'jobId' in review:
+        transact_items.append({'Update': job_update(tables['jobs'], review['jobId']['S'], {'sentimentDone': 1})})
+    try:
+        transact_write(dynamodb, transact_items)
+    except ClientError as e:
+        if not condition_failed(e):
+            raise
+    else:
+        if span:
+            span.add_item(review)
+        if sketches:
+            sketches.add_terms(f'lemmas-{overall_sentiment}', text.split())
+
+def get_tables():
+    return {
+        'reviews': get_parameter(ssm, '/review-app/tables/reviews'),
+        'aggregates': get_parameter(ssm, '/review-app/tables/aggregates'),
+        'products': get_parameter(ssm, '/review-app/tables/products'),
+        'sketches': get_parameter(ssm, '/review-app/tables/sketches'),
+        'jobs': get_parameter(ssm, '/review-app/tables/jobs')
+    }
+
+def analyze_records(records, tables):
+    failures = []
+    sketches = SketchWriter(dynamodb, tables['sketches'], 'sentiment')
+    span = Span('sentiment')
+    for record in records:
+        try:
+            analyze_review(record, tables, sketches, span)
+        except Exception as e:
+            print(f"Failed to analyze {record['dynamodb']['Keys']['reviewId']['S']}: {e}")
+            failures.append({'itemIdentifier': record['dynamodb']['SequenceNumber']})
+    span.emit(failed=len(failures))
+    # Sketches are approximate anyway; losing one invocation's part is better
+    # than failing (and re-counting) a batch whose reviews are all written
+    try:
+        sketches.flush()
+    except Exception as e:
+        print(f"Could not write sketches: {e}")
+    return failures
+
+def handle_batch(event):
+    # Step Functions Map iteration, fed by the ProfanityCheck step. Reviews that
+    # already have a label are skipped by the PENDING condition on retries.
+    tables = get_tables()
+    records = load_reviews(dynamodb, tables['reviews'], event['reviews'])
+    failures = analyze_records(records, tables)
+    limiter.emit_metrics('sentiment')
+    if failures:
+        raise RuntimeError(f"Sentiment analysis failed for {[f['itemIdentifier'] for f in failures]}")
+    return {'reviews': event['reviews']}
+
+def handler(event, context):
+    if 'reviews' in event:
+        return handle_batch(event)
+
+    # MODIFY records caused by our own updates end here, before any SSM or
+    # DynamoDB call is made
+    records = new_reviews(event, 'sentiment')
+    if not records:
+        return {'batchItemFailures': []}
+
+    # Failed records are reported back (ReportBatchItemFailures) so Lambda only
+    # retries from the first failed sequence number instead of the whole batch
+    failures = analyze_records(records, get_tables())
+    limiter.emit_metrics('sentiment')
+    return {'batchItemFailures': failures}
@@ -4,28 +4,152 @@
 awslocal s3 mb s3://reviews-bucket
 
 # Create DynamoDB tables
+# SentimentIndex answers "all reviews with label X"; all three indexes are sparse,
+# their keys (sentimentLabel, profaneReviewer, bannedFlag) are only written on
+# labelled reviews, profane reviews and banned users. Queried through
+# lambdas/common/queries.py; code/backfill_index_keys.py adds the keys to items
+# stored before they existed.
 awslocal dynamodb create-table \
   --table-name Reviews \
   --attribute-definitions \
       AttributeName=reviewerID,AttributeType=S \
       AttributeName=reviewId,AttributeType=S \
+      AttributeName=sentimentLabel,AttributeType=S \
+      AttributeName=profaneReviewer,AttributeType=S \
   --key-schema \
       AttributeName=reviewerID,KeyType=HASH \
       AttributeName=reviewId,KeyType=RANGE \
+  --global-secondary-indexes '[
+    {
+      "IndexName": "SentimentIndex",
+      "KeySchema": [{"AttributeName": "sentimentLabel", "KeyType": "HASH"}, {"AttributeName": "reviewId", "KeyType": "RANGE"}],
+      "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["overall", "profanityCheck"]}
+    },
+    {
+      "IndexName": "ProfaneIndex",
+      "KeySchema": [{"AttributeName": "profaneReviewer", "KeyType": "HASH"}, {"AttributeName": "reviewId", "KeyType": "RANGE"}],
+      "Projection": {"ProjectionType": "ALL"}
+    }
+  ]' \
   --billing-mode PAY_PER_REQUEST
 
 awslocal dynamodb create-table \
   --table-name Users \
   --attribute-definitions \
   AttributeName=reviewerID,AttributeType=S \
+  AttributeName=bannedFlag,AttributeType=S \
   --key-schema \
     AttributeName=reviewerID,KeyType=HASH \
+  --global-secondary-indexes '[
+    {
+      "IndexName": "BannedIndex",
+      "KeySchema": [{"AttributeName": "bannedFlag", "KeyType": "HASH"}, {"AttributeName": "reviewerID", "KeyType": "RANGE"}],
+      "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["unpoliteCount"]}
+    }
+  ]' \
   --billing-mode PAY_PER_REQUEST
 
+awslocal dynamodb create-table \
+  --table-name Aggregates \
+  --attribute-definitions \
+  AttributeName=aggregate,AttributeType=S \
+  --key-schema \
+    AttributeName=aggregate,KeyType=HASH \
+  --billing-mode PAY_PER_REQUEST
+
+# Per-product counters (reviews, rating sum, sentiment labels, profane) kept
+# by the handlers; one GetItem per asin, see code/product_stats.py
+awslocal dynamodb create-table \
+  --table-name ProductStats \
+  --attribute-definitions \
+  AttributeName=asin,AttributeType=S \
+  --key-schema \
+    AttributeName=asin,KeyType=HASH \
+  --billing-mode PAY_PER_REQUEST
+
+# Inverted index lemma#shard -> reviewId buckets (segment), written by
+# pre-process; searched with code/search_reviews.py
+awslocal dynamodb create-table \
+  --table-name SearchIndex \
+  --attribute-definitions \
+  AttributeName=term,AttributeType=S \
+  AttributeName=segment,AttributeType=S \
+  --key-schema \
+    AttributeName=term,KeyType=HASH \
+    AttributeName=segment,KeyType=RANGE \
+  --billing-mode PAY_PER_REQUEST
+
+# Partial Count-Min / HyperLogLog sketches written by every profanity and
+# sentiment invocation, keyed by day#name and merged when read
+awslocal dynamodb create-table \
+  --table-name Sketches \
+  --attribute-definitions \
+  AttributeName=sketch,AttributeType=S \
+  AttributeName=part,AttributeType=S \
+  --key-schema \
+    AttributeName=sketch,KeyType=HASH \
+    AttributeName=part,KeyType=RANGE \
+  --billing-mode PAY_PER_REQUEST
+
+# Progress of every ingested object: a meta item plus sharded stage counters,
+# read with code/job_status.py
+awslocal dynamodb create-table \
+  --table-name Jobs \
+  --attribute-definitions \
+  AttributeName=jobId,AttributeType=S \
+  AttributeName=part,AttributeType=S \
+  --key-schema \
+    AttributeName=jobId,KeyType=HASH \
+    AttributeName=part,KeyType=RANGE \
+  --billing-mode PAY_PER_REQUEST
+
+# Lines pre-process could not store, keyed by source object and byte offset;
+# replayed with code/replay_quarantine.py
+awslocal dynamodb create-table \
+  --table-name Quarantine \
+  --attribute-definitions \
+  AttributeName=sourceKey,AttributeType=S \
+  AttributeName=offset,AttributeType=N \
+  --key-schema \
+    AttributeName=sourceKey,KeyType=HASH \
+    AttributeName=offset,KeyType=RANGE \
+  --billing-mode PAY_PER_REQUEST
+
+# Bytes and block hashes already ingested per object, so re-uploads with
+# appended lines only process the new lines
+awslocal dynamodb create-table \
+  --table-name IngestState \
+  --attribute-definitions \
+  AttributeName=sourceKey,AttributeType=S \
+  --key-schema \
+    AttributeName=sourceKey,KeyType=HASH \
+  --billing-mode PAY_PER_REQUEST
+
+# Shared cache of processed review text, keyed by content hash. pre-process
+# only uses it when its environment sets TEXT_CACHE_TABLE=TextCache.
+awslocal dynamodb create-table \
+  --table-name TextCache \
+  --attribute-definitions \
+  AttributeName=textHash,AttributeType=S \
+  --key-schema \
+    AttributeName=textHash,KeyType=HASH \
+  --billing-mode PAY_PER_REQUEST
+
+awslocal dynamodb update-time-to-live \
+  --table-name TextCache \
+  --time-to-live-specification Enabled=true,AttributeName=expiresAt
+
 # Store configuration in SSM
 awslocal ssm put-parameter --name /review-app/buckets/reviews --type "String" --value "reviews-bucket"
 awslocal ssm put-parameter --name /review-app/tables/reviews --type "String" --value "Reviews"
 awslocal ssm put-parameter --name /review-app/tables/users --type "String" --value "Users"
+awslocal ssm put-parameter --name /review-app/tables/aggregates --type "String" --value "Aggregates"
+awslocal ssm put-parameter --name /review-app/tables/quarantine --type "String" --value "Quarantine"
+awslocal ssm put-parameter --name /review-app/tables/ingest-state --type "String" --value "IngestState"
+awslocal ssm put-parameter --name /review-app/tables/products --type "String" --value "ProductStats"
+awslocal ssm put-parameter --name /review-app/tables/search --type "String" --value "SearchIndex"
+awslocal ssm put-parameter --name /review-app/tables/sketches --type "String" --value "Sketches"
+awslocal ssm put-parameter --name /review-app/tables/jobs --type "String" --value "Jobs"
 
 awslocal dynamodb update-table \
   --table-name Reviews \
@@ -34,13 +158,17 @@ awslocal dynamodb update-table \
     "StreamViewType": "NEW_IMAGE"
   }'
 
+# INGEST_VERIFY=full (the default) reads a re-uploaded object in full to find
+# its changed blocks, so appending a few lines to a large object costs a GET of
+# the whole object. INGEST_VERIFY=append reads only the new bytes of a grown
+# object, but misses edits before its old end.
 awslocal lambda create-function \
    --function-name pre-process \
    --runtime python3.13 \
    --handler pre_process.handler \
    --zip-file fileb://package.zip \
    --role arn:aws:iam::000000000000:role/lambda-role \
-   --environment Variables="{STAGE=local}"
+   --environment Variables="{STAGE=local,INGEST_VERIFY=${INGEST_VERIFY:-full}}"
 
 awslocal lambda create-function \
     --function-name profanity \
@@ -69,13 +197,20 @@ awslocal s3api put-bucket-notification-configuration \
     ]
   }'
 
+# Both consumers only need new reviews. Without the filter every update they
+# make to a review comes back as a MODIFY record and invokes both of them again.
+# Reviews by banned users (stored with a reviewStatus) are left out as well.
 LATEST_STREAM_ARN=$(awslocal dynamodb describe-table --table-name Reviews --query "Table.LatestStreamArn" --output text)
 awslocal lambda create-event-source-mapping \
   --function-name profanity \
   --event-source-arn "$LATEST_STREAM_ARN" \
-  --starting-position LATEST
+  --starting-position LATEST \
+  --function-response-types ReportBatchItemFailures \
+  --filter-criteria '{"Filters": [{"Pattern": "{\"eventName\": [\"INSERT\"], \"dynamodb\": {\"NewImage\": {\"reviewStatus\": {\"S\": [{\"exists\": false}]}}}}"}]}'
 
 awslocal lambda create-event-source-mapping \
   --function-name sentiment \
   --event-source-arn "$LATEST_STREAM_ARN" \
-  --starting-position LATEST
\ No newline at end of file
+  --starting-position LATEST \
+  --function-response-types ReportBatchItemFailures \
+  --filter-criteria '{"Filters": [{"Pattern": "{\"eventName\": [\"INSERT\"], \"dynamodb\": {\"NewImage\": {\"reviewStatus\": {\"S\": [{\"exists\": false}]}}}}"}]}'
\ No newline at end of file
@@ -9,21 +9,109 @@ awslocal dynamodb create-table \
   --attribute-definitions \
       AttributeName=reviewerID,AttributeType=S \
       AttributeName=reviewId,AttributeType=S \
+      AttributeName=sentimentLabel,AttributeType=S \
+      AttributeName=profaneReviewer,AttributeType=S \
   --key-schema \
       AttributeName=reviewerID,KeyType=HASH \
       AttributeName=reviewId,KeyType=RANGE \
+  --global-secondary-indexes '[
+    {
+      "IndexName": "SentimentIndex",
+      "KeySchema": [{"AttributeName": "sentimentLabel", "KeyType": "HASH"}, {"AttributeName": "reviewId", "KeyType": "RANGE"}],
+      "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["overall", "profanityCheck"]}
+    },
+    {
+      "IndexName": "ProfaneIndex",
+      "KeySchema": [{"AttributeName": "profaneReviewer", "KeyType": "HASH"}, {"AttributeName": "reviewId", "KeyType": "RANGE"}],
+      "Projection": {"ProjectionType": "ALL"}
+    }
+  ]' \
   --billing-mode PAY_PER_REQUEST
 
 awslocal dynamodb create-table \
   --table-name Users \
-  --attribute-definitions AttributeName=reviewerID,AttributeType=S \
+  --attribute-definitions \
+      AttributeName=reviewerID,AttributeType=S \
+      AttributeName=bannedFlag,AttributeType=S \
   --key-schema AttributeName=reviewerID,KeyType=HASH \
+  --global-secondary-indexes '[
+    {
+      "IndexName": "BannedIndex",
+      "KeySchema": [{"AttributeName": "bannedFlag", "KeyType": "HASH"}, {"AttributeName": "reviewerID", "KeyType": "RANGE"}],
+      "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["unpoliteCount"]}
+    }
+  ]' \
+  --billing-mode PAY_PER_REQUEST
+
+awslocal dynamodb create-table \
+  --table-name Aggregates \
+  --attribute-definitions AttributeName=aggregate,AttributeType=S \
+  --key-schema AttributeName=aggregate,KeyType=HASH \
+  --billing-mode PAY_PER_REQUEST
+
+awslocal dynamodb create-table \
+  --table-name ProductStats \
+  --attribute-definitions AttributeName=asin,AttributeType=S \
+  --key-schema AttributeName=asin,KeyType=HASH \
+  --billing-mode PAY_PER_REQUEST
+
+awslocal dynamodb create-table \
+  --table-name SearchIndex \
+  --attribute-definitions \
+      AttributeName=term,AttributeType=S \
+      AttributeName=segment,AttributeType=S \
+  --key-schema \
+      AttributeName=term,KeyType=HASH \
+      AttributeName=segment,KeyType=RANGE \
+  --billing-mode PAY_PER_REQUEST
+
+awslocal dynamodb create-table \
+  --table-name Sketches \
+  --attribute-definitions \
+      AttributeName=sketch,AttributeType=S \
+      AttributeName=part,AttributeType=S \
+  --key-schema \
+      AttributeName=sketch,KeyType=HASH \
+      AttributeName=part,KeyType=RANGE \
+  --billing-mode PAY_PER_REQUEST
+
+awslocal dynamodb create-table \
+  --table-name Jobs \
+  --attribute-definitions \
+      AttributeName=jobId,AttributeType=S \
+      AttributeName=part,AttributeType=S \
+  --key-schema \
+      AttributeName=jobId,KeyType=HASH \
+      AttributeName=part,KeyType=RANGE \
+  --billing-mode PAY_PER_REQUEST
+
+awslocal dynamodb create-table \
+  --table-name Quarantine \
+  --attribute-definitions \
+      AttributeName=sourceKey,AttributeType=S \
+      AttributeName=offset,AttributeType=N \
+  --key-schema \
+      AttributeName=sourceKey,KeyType=HASH \
+      AttributeName=offset,KeyType=RANGE \
+  --billing-mode PAY_PER_REQUEST
+
+awslocal dynamodb create-table \
+  --table-name IngestState \
+  --attribute-definitions AttributeName=sourceKey,AttributeType=S \
+  --key-schema AttributeName=sourceKey,KeyType=HASH \
   --billing-mode PAY_PER_REQUEST
 
 # Store configuration in SSM
 awslocal ssm put-parameter --name /review-app/buckets/reviews --type String --value reviews-bucket
 awslocal ssm put-parameter --name /review-app/tables/reviews --type String --value Reviews
 awslocal ssm put-parameter --name /review-app/tables/users --type String --value Users
+awslocal ssm put-parameter --name /review-app/tables/aggregates --type String --value Aggregates
+awslocal ssm put-parameter --name /review-app/tables/quarantine --type String --value Quarantine
+awslocal ssm put-parameter --name /review-app/tables/ingest-state --type String --value IngestState
+awslocal ssm put-parameter --name /review-app/tables/products --type String --value ProductStats
+awslocal ssm put-parameter --name /review-app/tables/search --type String --value SearchIndex
+awslocal ssm put-parameter --name /review-app/tables/sketches --type String --value Sketches
+awslocal ssm put-parameter --name /review-app/tables/jobs --type String --value Jobs
 
 # Create Lambda functions
 for func in pre_process profanity sentiment
@@ -38,36 +126,51 @@ do
 done
 
 # Create Step Functions state machine definition
+# pre_process starts one execution per SFN_BATCH_SIZE reviews with input
+# {"batches": [{"reviews": [{"reviewerID": ..., "reviewId": ...}, ...]}, ...]};
+# the Map state runs up to MAP_CONCURRENCY batches at once.
+MAP_CONCURRENCY=${MAP_CONCURRENCY:-4}
 cat <<EOF > /tmp/statemachine-definition.json
 {
-  "Comment": "Sequential Review Processing Workflow",
-  "StartAt": "ProfanityCheck",
+  "Comment": "Batched Review Processing Workflow",
+  "StartAt": "ProcessBatches",
   "States": {
-    "ProfanityCheck": {
-      "Type": "Task",
-      "Resource": "arn:aws:lambda:us-east-1:000000000000:function:profanity",
-      "Next": "SentimentAnalysis",
-      "Retry": [
-        {
-          "ErrorEquals": ["States.ALL"],
-          "IntervalSeconds": 1,
-          "MaxAttempts": 3,
-          "BackoffRate": 2
-        }
-      ]
-    },
-    "SentimentAnalysis": {
-      "Type": "Task",
-      "Resource": "arn:aws:lambda:us-east-1:000000000000:function:sentiment",
+    "ProcessBatches": {
+      "Type": "Map",
+      "ItemsPath": "\$.batches",
+      "MaxConcurrency": $MAP_CONCURRENCY,
       "End": true,
-      "Retry": [
-        {
-          "ErrorEquals": ["States.ALL"],
-          "IntervalSeconds": 1,
-          "MaxAttempts": 3,
-          "BackoffRate": 2
+      "Iterator": {
+        "StartAt": "ProfanityCheck",
+        "States": {
+          "ProfanityCheck": {
+            "Type": "Task",
+            "Resource": "arn:aws:lambda:us-east-1:000000000000:function:profanity",
+            "Next": "SentimentAnalysis",
+            "Retry": [
+              {
+                "ErrorEquals": ["States.ALL"],
+                "IntervalSeconds": 1,
+                "MaxAttempts": 3,
+                "BackoffRate": 2
+              }
+            ]
+          },
+          "SentimentAnalysis": {
+            "Type": "Task",
+            "Resource": "arn:aws:lambda:us-east-1:000000000000:function:sentiment",
+            "End": true,
+            "Retry": [
+              {
+                "ErrorEquals": ["States.ALL"],
+                "IntervalSeconds": 1,
+                "MaxAttempts": 3,
+                "BackoffRate": 2
+              }
+            ]
+          }
         }
-      ]
+      }
     }
   }
 }
@@ -82,10 +185,13 @@ awslocal stepfunctions create-state-machine \
 # Get the state machine ARN
 STATE_MACHINE_ARN=$(awslocal stepfunctions list-state-machines --query "stateMachines[?name=='review-state-machine'].stateMachineArn" --output text)
 
-# Update Lambda environments with the state machine ARN
+# Update Lambda environments with the state machine ARN. INGEST_VERIFY=full
+# (the default) reads a re-uploaded object in full to find its changed blocks,
+# so an append costs a GET of the whole object; INGEST_VERIFY=append reads only
+# the new bytes of a grown object but misses edits before its old end.
 awslocal lambda update-function-configuration \
   --function-name pre_process \
-  --environment Variables="{STAGE=local,STATE_MACHINE_ARN=$STATE_MACHINE_ARN}"
+  --environment Variables="{STAGE=local,STATE_MACHINE_ARN=$STATE_MACHINE_ARN,SFN_BATCH_SIZE=${SFN_BATCH_SIZE:-25},INGEST_VERIFY=${INGEST_VERIFY:-full}}"
 
 # Set up S3 trigger to start the workflow
 PREPROCESS_ARN=$(awslocal lambda get-function --function-name pre_process --query 'Configuration.FunctionArn' --output text)
@@ -5,8 +5,10 @@ os.environ["AWS_DEFAULT_REGION"] = "us-east-1"
 os.environ["AWS_ACCESS_KEY_ID"] = "test"
 os.environ["AWS_SECRET_ACCESS_KEY"] = "test"
 os.environ["STAGE"] = "local"
+sys.path.append(os.path.join(os.getcwd(), 'lambdas'))
 import boto3
 from lambdas.pre_process.pre_process import handler  # your Lambda handler
+from common.scan import bulk_delete, parallel_count
 
 # === CONFIGURATION ===
 LOCAL_FILE_PATH = os.path.join(os.getcwd(), 'data/test.json')
@@ -34,8 +36,7 @@ table = dynamodbRes.Table('Reviews')
 def overview_reviews_table():
     print("\n=== Overview of Reviews DB ===")
     # Get total count
-    response = table.scan(Select='COUNT')
-    print(f"Total reviews: {response['Count']}")
+    print(f"Total reviews: {parallel_count(dynamodb, 'Reviews')}")
 
     # Get sample items
     response = table.scan(Limit=3)
@@ -45,15 +46,13 @@ def overview_reviews_table():
 
 def clean_reviews_table():
     print("\n=== Cleaning Reviews DB ===")
-    scan = table.scan(ProjectionExpression='reviewerID, reviewId')
-    items = scan.get('Items', [])
-    if not items:
+    deleted = bulk_delete(dynamodb, 'Reviews')
+    # Forget what was ingested, otherwise the re-upload below is skipped as unchanged
+    bulk_delete(dynamodb, 'IngestState')
+    if not deleted:
         print("No items to delete.")
         return
-    with table.batch_writer() as batch:
-        for each in items:
-            batch.delete_item(Key={'reviewerID': each['reviewerID'], 'reviewId': each['reviewId']})
-    print(f"Deleted {len(items)} items.")
+    print(f"Deleted {deleted} items.")
 
 def main():
     # === STEP 1: Overview before cleaning ===